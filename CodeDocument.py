@@ -0,0 +1,391 @@
+from bisect import bisect_right
+from difflib import SequenceMatcher
+from pygments.lexers import get_lexer_by_name, guess_lexer, guess_lexer_for_filename
+from pygments.util import ClassNotFound
+from pygments.styles import get_style_by_name
+from pygments.token import Token
+import re
+
+
+class CodeDocument:
+    # The text of a DynamicCode without any mobjects (this module does not import manim), so edits can be resolved,
+    # applied, diffed and highlighted headless, e.g. to check an edit script in a quick test.
+    # DynamicCode is a view of a CodeDocument: each line of the document is a line of glyphs.
+    #
+    # The text is kept as a list of lines (joined lazily) with per line caches:
+    #   glyph_counts: prefix counts of glyphs (non-whitespace chars) of each line, None until needed
+    #   line_colors: syntax highlighting colors of each line's glyphs, None until needed
+    #   safe_lines: whether the lexer is in its initial state at the start of each line (see relex)
+    # Positions are (line_index, char_index) or a line_index (see get_char_pos). Flat char offsets (see offset
+    # and position) are found by bisecting the line start offsets, which are only recomputed over the lines
+    # changed by an edit and shifted for the lines after them.
+
+    # lines in replaced blocks are paired if similar enough (see diff_edits)
+    diff_cutoff = 0.5
+    diff_lookahead = 4  # number of new lines each old line is compared with
+
+    def __init__(self, text: str = '', language: str | None = None, style: str = 'vim', default_color: str = '#FFFFFF'):
+        # language = None -> guessed from the text
+        self.language = language
+        self.style = style
+        self.default_color = default_color
+        self._lexer = None
+        self.set_text(text)
+
+    @classmethod
+    def from_file(cls, file_name: str, language: str | None = None, **kwargs) -> 'CodeDocument':
+        # language = None -> guessed from the file name and contents
+        with open(file_name, encoding='utf-8') as f:
+            text = f.read()
+        if language is None:
+            try:
+                language = guess_lexer_for_filename(file_name, text).aliases[0]
+            except ClassNotFound:
+                pass
+        return cls(text, language=language, **kwargs)
+
+    @property
+    def text(self) -> str:
+        # joined lazily as edits only update the list of lines
+        if self._text is None:
+            self._text = '\n'.join(self.lines)
+        return self._text
+
+    def set_text(self, text: str):
+        self._text = text
+        self.lines = text.split('\n')
+        self.glyph_counts = [None] * len(self.lines)
+        self.line_colors = None
+        self.safe_lines = None
+        self._line_starts = [0]  # offsets of the first char of the lines, valid for as many lines as it has
+
+    def set_lines(self, lines: list[str], glyph_counts: list, line_colors: list | None, safe_lines: list | None, changed_rows: tuple[int, int, int] | None = None):
+        # swap in lines (and their caches) computed elsewhere, e.g. by DynamicCode.plan_edits
+        # changed_rows = (start_row, old_stop_row, new_stop_row) -> only the old lines start_row up to old_stop_row
+        # were replaced, by lines start_row up to new_stop_row, None -> all lines may have changed
+        self.lines = lines
+        self.glyph_counts = glyph_counts
+        self.line_colors = line_colors
+        self.safe_lines = safe_lines
+        self._text = None
+        if changed_rows is None:
+            self._line_starts = [0]
+        else:
+            self._splice_line_starts(*changed_rows)
+
+    def copy(self) -> 'CodeDocument':
+        document = CodeDocument.__new__(CodeDocument)
+        document.__dict__.update(self.__dict__)
+        document.lines = list(self.lines)
+        document.glyph_counts = list(self.glyph_counts)
+        document.line_colors = None if self.line_colors is None else list(self.line_colors)
+        document.safe_lines = None if self.safe_lines is None else list(self.safe_lines)
+        document._line_starts = list(self._line_starts)
+        return document
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    # ----- positions -----
+
+    @staticmethod
+    def get_char_pos(pos: int | tuple[int, int], lines: list) -> tuple[int, int]:
+        # (line_index, char_index) of pos in lines
+        if len(lines) == 0:
+            return 0, 0
+
+        # pos -> line and char indices
+        if isinstance(pos, int):
+            # first char of line at pos
+            line_index, char_index = pos, 0
+        else:
+            line_index, char_index = pos
+
+        # None -> end of line
+        if char_index is None:
+            char_index = len(lines[line_index])
+
+        # negative -> positive indices
+        if line_index < 0:
+            line_index = len(lines) + line_index
+        if char_index < 0:
+            char_index = len(lines[line_index]) + char_index
+
+        return line_index, char_index
+
+    def resolve(self, pos: int | tuple[int, int]) -> tuple[int, int]:
+        return self.get_char_pos(pos, self.lines)
+
+    def offset(self, pos: int | tuple[int, int]) -> int:
+        # flat char offset of pos in text
+        line_index, char_index = self.resolve(pos)
+        return self._line_start(line_index) + char_index
+
+    def position(self, offset: int) -> tuple[int, int]:
+        # (line_index, char_index) of a flat char offset in text
+        self._line_start(len(self.lines) - 1)
+        line_index = bisect_right(self._line_starts, offset) - 1
+        return line_index, offset - self._line_starts[line_index]
+
+    def _line_start(self, line_index: int) -> int:
+        line_starts = self._line_starts
+        for i in range(len(line_starts), line_index + 1):
+            line_starts.append(line_starts[-1] + len(self.lines[i - 1]) + 1)
+        return line_starts[line_index]
+
+    def _splice_line_starts(self, start_row: int, old_stop_row: int, new_stop_row: int):
+        # Old lines start_row up to old_stop_row were replaced by lines start_row up to new_stop_row.
+        # Starts before the replaced lines are kept, starts of the replaced lines are recomputed and
+        # starts of the lines after them (if known) are shifted by the change in length.
+        line_starts = self._line_starts
+        tail = line_starts[old_stop_row:]
+        del line_starts[start_row + 1:]
+        if tail:
+            delta = self._line_start(new_stop_row) - tail[0]
+            line_starts[new_stop_row:] = [line_start + delta for line_start in tail]
+
+    # ----- edits -----
+
+    def resolve_edits(self, edits: list[tuple], lines: list[str] | None = None) -> list[tuple[tuple[int, int], tuple[int, int], str]]:
+        # Edits (start, stop, code) with (line, char) positions sorted by position, lines defaults to the document's.
+        # Each edit replaces the code between positions start and stop with code, stop = None -> end of code.
+        # All positions refer to the code before any of the edits and edits may not overlap.
+        if lines is None:
+            lines = self.lines
+        resolved = []
+        for start, stop, code in edits:
+            start = self.get_char_pos(start, lines)
+            if stop is None:
+                # None -> end of code
+                stop = (len(lines), 0)
+            else:
+                stop = self.get_char_pos(stop, lines)
+            if lines and stop[0] >= len(lines):
+                # past the last line -> end of code
+                stop = (len(lines) - 1, len(lines[-1]))
+            if stop < start:
+                raise ValueError(f'Edit stop {stop} is before its start {start}.')
+            resolved.append((start, stop, code))
+        resolved.sort(key=lambda edit: edit[:2])
+        for prev_edit, edit in zip(resolved[:-1], resolved[1:]):
+            if edit[0] < prev_edit[1]:
+                raise ValueError(f'Edits {prev_edit} and {edit} overlap.')
+        return resolved
+
+    def apply_edits(self, edits: list[tuple]) -> list[tuple[int, int]]:
+        # Apply edits (see resolve_edits) to the text, only the edited lines are spliced and their caches reset.
+        # Highlighting, if already known, is updated from the edited lines on. Returns the (start, stop) rows
+        # of the edited lines after the edits.
+        edits = self.resolve_edits(edits)
+        n_old_lines = len(self.lines)
+        # splice from the last edit backwards so that earlier positions stay valid
+        n_new_rows = []
+        for (start_line_index, start_char_index), (stop_line_index, stop_char_index), code in reversed(edits):
+            new_lines = (self.lines[start_line_index][:start_char_index] + code + self.lines[stop_line_index][stop_char_index:]).split('\n')
+            rows = slice(start_line_index, stop_line_index + 1)
+            self.lines[rows] = new_lines
+            self.glyph_counts[rows] = [None] * len(new_lines)
+            if self.line_colors is not None:
+                self.line_colors[rows] = [[] for line in new_lines]
+                self.safe_lines[rows] = [None] * len(new_lines)
+                if start_line_index == 0:
+                    self.safe_lines[0] = True
+            n_new_rows.append(len(new_lines))
+        edited_rows = []
+        delta = 0
+        for ((start_line_index, start_char_index), (stop_line_index, stop_char_index), code), n_rows in zip(edits, reversed(n_new_rows)):
+            edited_rows.append((start_line_index + delta, start_line_index + delta + n_rows))
+            delta += n_rows - (stop_line_index - start_line_index + 1)
+        if edited_rows:
+            self._text = None
+            old_stop_row = edits[-1][1][0] + 1
+            self._splice_line_starts(edits[0][0][0], old_stop_row, old_stop_row + len(self.lines) - n_old_lines)
+        if self.line_colors is not None:
+            relexed_stop_row = 0
+            for start_row, stop_row in edited_rows:
+                if stop_row > relexed_stop_row:
+                    relexed_stop_row = self.relex(self.lines, self.line_colors, self.safe_lines, max(start_row, relexed_stop_row), stop_row - 1)[1]
+        return edited_rows
+
+    def replace_edits(self, pattern: str | re.Pattern, repl, count: int | None = None, flags: int = 0, start: int | tuple[int, int] = (0, 0), stop: int | tuple[int, int] | None = None) -> list[tuple[tuple[int, int], tuple[int, int], str]]:
+        # Edits replacing the first count (None -> all) matches of the regex pattern between positions start and
+        # stop (None -> end of code) with repl, which is as for re.sub (a template string or a function of the match).
+        text = self.text
+        pos = self.offset(start)
+        endpos = len(text) if stop is None else self.offset(stop)
+        edits = []
+        for match in re.compile(pattern, flags).finditer(text, pos, endpos):
+            if count is not None and len(edits) >= count:
+                break
+            code = repl(match) if callable(repl) else match.expand(repl)
+            edits.append((self.position(match.start()), self.position(match.end()), code))
+        return edits
+
+    @staticmethod
+    def diff_edits(old_code: str, new_code: str) -> list[tuple[tuple[int, int], tuple[int, int], str]]:
+        # Edits (see resolve_edits) that turn old_code into new_code.
+        # Lines are matched first. In changed blocks of lines, each old line is paired with the most similar of the
+        # next few new lines and paired lines are matched char by char, other lines are removed or inserted whole.
+        # So the cost grows with the number of changed lines rather than the square of the size of the block.
+        old_lines = old_code.split('\n')
+        new_lines = new_code.split('\n')
+        edits = []
+
+        def line_edits(i1: int, i2: int, j1: int, j2: int):
+            # replace old lines i1 up to i2 with new lines j1 up to j2
+            if i1 == i2 and j1 == j2:
+                return
+            if j1 == j2:
+                if i2 < len(old_lines):
+                    edits.append(((i1, 0), (i2, 0), ''))
+                elif i1 > 0:
+                    edits.append(((i1 - 1, len(old_lines[i1 - 1])), (i2 - 1, len(old_lines[i2 - 1])), ''))
+                else:
+                    edits.append(((0, 0), (i2 - 1, len(old_lines[i2 - 1])), ''))
+            elif i1 == i2:
+                inserted_code = '\n'.join(new_lines[j1:j2])
+                if i1 < len(old_lines):
+                    edits.append(((i1, 0), (i1, 0), inserted_code + '\n'))
+                else:
+                    end = (i1 - 1, len(old_lines[i1 - 1]))
+                    edits.append((end, end, '\n' + inserted_code))
+            else:
+                edits.append(((i1, 0), (i2 - 1, len(old_lines[i2 - 1])), '\n'.join(new_lines[j1:j2])))
+
+        matcher = SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                continue
+            if tag != 'replace':
+                line_edits(i1, i2, j1, j2)
+                continue
+            # pair similar lines of the replaced block in order
+            i, j = i1, j1
+            for old_index in range(i1, i2):
+                best_ratio, best = CodeDocument.diff_cutoff, None
+                for new_index in range(j, min(j + CodeDocument.diff_lookahead, j2)):
+                    line_matcher = SequenceMatcher(None, old_lines[old_index], new_lines[new_index], autojunk=False)
+                    if line_matcher.real_quick_ratio() >= best_ratio and line_matcher.quick_ratio() >= best_ratio:
+                        ratio = line_matcher.ratio()
+                        if ratio >= best_ratio:
+                            best_ratio, best = ratio, (new_index, line_matcher)
+                if best is None:
+                    continue
+                new_index, line_matcher = best
+                line_edits(i, old_index, j, new_index)
+                new_line = new_lines[new_index]
+                for char_tag, a1, a2, b1, b2 in line_matcher.get_opcodes():
+                    if char_tag != 'equal':
+                        edits.append(((old_index, a1), (old_index, a2), new_line[b1:b2]))
+                i, j = old_index + 1, new_index + 1
+            line_edits(i, i2, j, j2)
+        return edits
+
+    # ----- glyphs -----
+
+    @staticmethod
+    def count_glyphs(string: str) -> int:
+        # ignore whitespace to match glyph indices
+        return sum(not char.isspace() for char in string)
+
+    def glyph_index(self, line_index: int, char_index: int) -> int:
+        # index of the glyph for the char at (line_index, char_index) among the line's glyphs
+        # (or of the next glyph if it is whitespace) from the line's cached prefix counts of glyphs
+        glyph_counts = self.glyph_counts[line_index]
+        if glyph_counts is None:
+            glyph_counts = [0]
+            for char in self.lines[line_index]:
+                glyph_counts.append(glyph_counts[-1] + (not char.isspace()))
+            self.glyph_counts[line_index] = glyph_counts
+        return glyph_counts[char_index]
+
+    # ----- syntax highlighting -----
+
+    def get_line_colors(self) -> list[list[str]]:
+        if self.line_colors is None:
+            self.line_colors = [[] for line in self.lines]
+            self.safe_lines = [True] + [None] * (len(self.lines) - 1)
+            self.relex(self.lines, self.line_colors, self.safe_lines, 0, len(self.lines))
+        return self.line_colors
+
+    def get_lexer(self):
+        if self._lexer is None:
+            if self.language is not None:
+                self._lexer = get_lexer_by_name(self.language, stripnl=False)
+            else:
+                self._lexer = guess_lexer(self.text, stripnl=False)
+        return self._lexer
+
+    @staticmethod
+    def token_color(style, token_type, default_color: str) -> str:
+        color = style.style_for_token(token_type)['color']
+        return '#' + color if color else default_color
+
+    @staticmethod
+    def lexer_state(tokens, index: int) -> list[str] | None:
+        # State stack of the pygments lexer running the tokens generator as it yields a token at index,
+        # None -> unknown. pygments yields a token before the state transition of its match, so this is the state
+        # the token was matched in if the token starts the match, but not for further tokens of a match that a
+        # callback splits into several tokens (e.g. a heredoc). RegexLexers keep their state in a local list
+        # (statestack) and ExtendedRegexLexers in a local context (ctx.stack). Lexers that wrap another lexer's
+        # tokens (e.g. PHP) hide the state. No idea if there is a cleaner way to get at the lexer state.
+        frame = tokens.gi_frame
+        if frame is None:
+            return None
+        f_locals = frame.f_locals
+        if 'statestack' in f_locals:
+            return f_locals['statestack'] if f_locals.get('pos') == index else None
+        ctx = f_locals.get('ctx', None)
+        if ctx is not None and hasattr(ctx, 'stack'):
+            # callbacks may move ctx.pos, e.g. past a heredoc whose lines they then yield
+            return ctx.stack if ctx.pos == index and tokens.gi_yieldfrom is None else None
+        return None
+
+    def relex(self, lines: list[str], colors: list[list[str]], safe_lines: list[bool | None], first_row: int, last_row: int = None) -> tuple[int, int]:
+        # Update the syntax highlighting colors of lines from first_row through last_row (default first_row) in place.
+        # safe_lines[row] is whether the lexer is in its initial state at the start of row (None -> unknown).
+        # Lexing starts at the last safe row at or before first_row and stops once the lexer is back in a safe
+        # state at the start of a row after last_row that was already safe, as the highlighting from there on
+        # is unchanged. Returns the range of rows (start_row, stop_row) that were lexed.
+        # Caveat: some lexers match a whole multiline construct with a single regex (e.g. /* */ in javascript or
+        # <!-- --> in html), which fails while the construct is unterminated. Terminating it later on recolors the
+        # lines in between, which may be before the last safe row, and those are not updated here.
+        if last_row is None:
+            last_row = first_row
+        start_row = first_row
+        while start_row > 0 and not safe_lines[start_row]:
+            start_row -= 1
+        style = get_style_by_name(self.style)
+        token_colors = {}
+        tokens = self.get_lexer().get_tokens_unprocessed('\n'.join(lines[start_row:]) + '\n')
+        row = start_row
+        row_colors = []
+        pending = False  # row might start in the initial state, which is known once the lexer yields its next token
+        for index, token_type, value in tokens:
+            if pending:
+                # A row is safe if the previous line ends in a whitespace token and the lexer starts the row's first
+                # token in its root state. Rows where the lexer state is unknown are never safe, so relexing carries
+                # on to the end of the code.
+                safe = self.lexer_state(tokens, index) == ['root']
+                if safe and row > last_row and safe_lines[row]:
+                    return start_row, row
+                safe_lines[row] = safe
+                pending = False
+            color = token_colors.get(token_type, None)
+            if color is None:
+                color = token_colors[token_type] = self.token_color(style, token_type, self.default_color)
+            for i, char in enumerate(value):
+                if char == '\n':
+                    colors[row] = row_colors
+                    row += 1
+                    row_colors = []
+                    if row == len(lines):
+                        return start_row, row
+                    if i == len(value) - 1 and token_type in Token.Text:
+                        pending = True
+                    else:
+                        # inside a multiline token
+                        safe_lines[row] = False
+                elif not char.isspace():
+                    row_colors.append(color)
+        return start_row, row
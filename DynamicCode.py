@@ -1,18 +1,561 @@
 from manim import *
 from manim.mobject.text.text_mobject import remove_invisible_chars
+from CodeDocument import CodeDocument
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import copy
+import functools
+import hashlib
+import importlib
+import importlib.metadata
+import json
 import numpy as np
+import os
 import re
+import shutil
+import time
+
+
+# Monospace layout metrics are the same for every DynamicCode sharing a font setup, so they are only measured once.
+# (font, font_size, line_spacing) -> metrics dict, see DynamicCode._layout_metrics
+_layout_metrics_cache: dict[tuple, dict] = {}
+
+
+def _leaf_style(leaf: VMobject) -> list[float]:
+    # [*fill rgba, *stroke rgba, stroke width] of a glyph or background leaf
+    return [*leaf.get_fill_rgbas()[0], *leaf.get_stroke_rgbas()[0], leaf.get_stroke_width()]
+
+
+def _package_version(package: str) -> str:
+    # installed version of package, falls back to the module's __version__ (e.g. when run from a source checkout)
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        try:
+            return str(importlib.import_module(package).__version__)
+        except (ImportError, AttributeError):
+            return 'unknown'
+
+
+def _leaf_from_arrays(points: np.ndarray, style: np.ndarray) -> VMobject:
+    # inverse of leaf.points and _leaf_style(leaf)
+    leaf = VMobject()
+    leaf.set_points(np.array(points, dtype=float))
+    leaf.set_fill(rgb_to_color(style[0:3]), opacity=style[3])
+    leaf.set_stroke(rgb_to_color(style[4:7]), width=style[8], opacity=style[7])
+    return leaf
+
+
+def _prerender_state(code: str, chars: str, language: str | None, style: str, default_color: str, font: str, font_size: float, line_spacing: float) -> tuple[set, dict]:
+    # Process pool job for EditScript.prerender: the glyph keys (char, color) needed to show code,
+    # and the geometry of chars rendered after an anchoring 'M' as picklable arrays {char: (col, points, style)}
+    # with points relative to the 'M'.
+    document = CodeDocument(code, language=language, style=style, default_color=default_color)
+    keys = set()
+    for line, colors in zip(document.lines, document.get_line_colors()):
+        keys.update(zip([char for char in line if not char.isspace()], colors))
+    rendered = {}
+    if chars:
+        glyphs = Text('M' + chars, font=font, font_size=font_size, line_spacing=line_spacing, disable_ligatures=True).submobjects
+        origin = glyphs[0].points[0]
+        for col, (char, glyph) in enumerate(zip(chars, glyphs[1:]), start=1):
+            rendered[char] = (col, np.array(glyph.points - origin), np.array(_leaf_style(glyph)))
+    return keys, rendered
+
+
+class GlyphCache:
+    # Process-wide LRU cache of rendered glyphs keyed by (char, color, font, font_size, style).
+    # Glyph points are stored relative to the glyph's cell origin and handed out as copies,
+    # so identical glyphs are only ever rendered once.
+    # Limit the cache size by number of glyphs and/or total number of points (None -> no limit).
+
+    def __init__(self, max_glyphs: int | None = 4096, max_points: int | None = None):
+        self.max_glyphs = max_glyphs
+        self.max_points = max_points
+        self._glyphs: OrderedDict[tuple, VMobject] = OrderedDict()
+        self._n_points = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def __len__(self) -> int:
+        return len(self._glyphs)
+    
+    def __contains__(self, key: tuple) -> bool:
+        return key in self._glyphs
+    
+    def get(self, key: tuple) -> VMobject | None:
+        glyph = self._glyphs.get(key, None)
+        if glyph is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._glyphs.move_to_end(key)
+        return glyph.copy()
+    
+    def put(self, key: tuple, glyph: VMobject):
+        if key in self._glyphs:
+            self._n_points -= len(self._glyphs.pop(key).points)
+        self._glyphs[key] = glyph
+        self._n_points += len(glyph.points)
+        self._evict()
+    
+    def resize(self, max_glyphs: int | None = None, max_points: int | None = None):
+        self.max_glyphs = max_glyphs
+        self.max_points = max_points
+        self._evict()
+    
+    def clear(self):
+        self._glyphs.clear()
+        self._n_points = 0
+    
+    def _evict(self):
+        # drop least recently used glyphs until within limits
+        while self._glyphs and (
+            (self.max_glyphs is not None and len(self._glyphs) > self.max_glyphs)
+            or (self.max_points is not None and self._n_points > self.max_points)
+        ):
+            key, glyph = self._glyphs.popitem(last=False)
+            self._n_points -= len(glyph.points)
+
+
+glyph_cache = GlyphCache()
+
+
+class SharedGlyph(VMobject):
+    # A glyph whose outline points are shared with every identical glyph (same char, color, font, etc.),
+    # each glyph only stores its own offset from the shared outline.
+    # Shifts (including moves during edits, copies for animations, and Transforms between shifted copies)
+    # only update the offset. Any other transform (scale, rotate, Write, ...) gives the glyph its own points.
+    # Note that in place writes to a shared glyph's points (glyph.points[i] = p rather than glyph.points = p) are lost,
+    # manim's own transforms always assign the points.
+
+    # (number of points, hash of the rounded outline) -> shared read-only outline
+    outlines: dict[tuple, np.ndarray] = {}
+
+    @classmethod
+    def share(cls, glyph: VMobject) -> VMobject:
+        # Turn glyph into a SharedGlyph in place (so any references to it stay valid),
+        # sharing its outline with any identical glyph shared before it.
+        if isinstance(glyph, cls) or glyph.submobjects:
+            return glyph
+        points = np.asarray(glyph.points, dtype=float)
+        if len(points) == 0:
+            return glyph
+        outline = points - points[0]
+        key = (len(outline), hashlib.blake2b(np.round(outline, 5).tobytes(), digest_size=16).digest())
+        outline = cls.outlines.setdefault(key, outline)
+        outline.setflags(write=False)
+        glyph.__dict__.pop('points', None)
+        glyph.__class__ = cls
+        glyph._outline = outline
+        glyph._offset = points[0].copy()
+        glyph._own_points = None
+        return glyph
+
+    @property
+    def points(self) -> np.ndarray:
+        if self._outline is None:
+            return self._own_points
+        return self._outline + self._offset
+
+    @points.setter
+    def points(self, points: np.ndarray):
+        outline = getattr(self, '_outline', None)
+        if outline is not None and np.shape(points) == outline.shape:
+            # still just a shifted copy of the outline?
+            offset = points[0] - outline[0]
+            if np.allclose(points, outline + offset, rtol=0, atol=1e-7):
+                self._offset = offset
+                return
+        self._outline = None
+        self._own_points = points
+
+    def get_num_points(self) -> int:
+        return len(self._outline if self._outline is not None else self._own_points)
+
+    def has_points(self) -> bool:
+        return self.get_num_points() > 0
+
+    def shift(self, *vectors) -> 'SharedGlyph':
+        if self._outline is None:
+            return super().shift(*vectors)
+        self._offset = self._offset + np.sum(np.array(vectors, dtype=float), axis=0)
+        return self
+
+    def __deepcopy__(self, memo):
+        # copies share the outline rather than duplicating it
+        if self._outline is not None:
+            memo[id(self._outline)] = self._outline
+        cls = self.__class__
+        result = cls.__new__(cls)
+        memo[id(self)] = result
+        for name, value in self.__dict__.items():
+            result.__dict__[name] = copy.deepcopy(value, memo)
+        return result
+
+
+class GlyphArrays:
+    # The opacities, colors and offsets of many glyphs as rows of a few shared arrays, so an animation frame updates
+    # all of them with one numpy op rather than a set_opacity, set_color or shift per glyph.
+    # Each glyph's rgbas (and SharedGlyph offset) becomes a view of its rows. manim's own set_opacity/set_color write
+    # into the rgbas in place and SharedGlyph.shift replaces the offset, so glyphs stay usable as normal afterwards.
+    # Values are per mobject in mobjects and apply to all of its glyphs (family members with points).
+    # Glyphs that own their points (see SharedGlyph) are still shifted one at a time.
+
+    rgbas_names = ('fill_rgbas', 'stroke_rgbas', 'background_stroke_rgbas')
+
+    def __init__(self, mobjects: list[Mobject], rgbas: bool = True, offsets: bool = False):
+        glyphs = {}  # id -> (glyph number, glyph)
+        pairs = []  # (mobject index, glyph number), a glyph may belong to several mobjects
+        for index, mobject in enumerate(mobjects):
+            for glyph in mobject.family_members_with_points():
+                pairs.append((index, glyphs.setdefault(id(glyph), (len(glyphs), glyph))[0]))
+        glyphs = [glyph for number, glyph in glyphs.values()]
+        self.n_mobjects = len(mobjects)
+        # (shared array, rows, mobject index of each row)
+        self.rgbas = [self._bind(glyphs, pairs, name) for name in self.rgbas_names] if rgbas else []
+        self.offsets = None
+        self.unique_offsets = True  # no glyph is in more than one mobject, so shifts need not be accumulated
+        self.own_points = []  # (glyph, mobject index)
+        if offsets:
+            rows = {}  # glyph number -> row
+            for number, glyph in enumerate(glyphs):
+                if isinstance(glyph, SharedGlyph) and glyph._outline is not None:
+                    rows[number] = len(rows)
+            shared = np.zeros((len(rows), 3))
+            for number, row in rows.items():
+                shared[row] = glyphs[number]._offset
+                glyphs[number]._offset = shared[row]
+            shared_pairs = [(index, rows[number]) for index, number in pairs if number in rows]
+            self.offsets = (
+                shared,
+                np.array([row for index, row in shared_pairs], dtype=int),
+                np.array([index for index, row in shared_pairs], dtype=int),
+            )
+            self.own_points = [(glyphs[number], index) for index, number in pairs if number not in rows]
+            self.unique_offsets = len(shared_pairs) == len(rows)
+
+    @staticmethod
+    def _bind(glyphs: list[VMobject], pairs: list[tuple[int, int]], name: str) -> tuple:
+        arrays = [np.asarray(getattr(glyph, name, np.zeros((0, 4))), dtype=float) for glyph in glyphs]
+        lengths = [len(array) for array in arrays]
+        starts = np.cumsum([0, *lengths])
+        shared = np.concatenate(arrays) if arrays else np.zeros((0, 4))
+        for glyph, start, length in zip(glyphs, starts, lengths):
+            if length:
+                setattr(glyph, name, shared[start:start + length])
+        rows = np.array([row for index, number in pairs for row in range(starts[number], starts[number + 1])], dtype=int)
+        indices = np.repeat(np.array([index for index, number in pairs], dtype=int), [lengths[number] for index, number in pairs])
+        return shared, rows, indices
+
+    def part(self, start: int, stop: int) -> 'GlyphArrays':
+        # the same arrays restricted to mobjects[start:stop]
+        part = GlyphArrays([])
+        part.n_mobjects = stop - start
+        def select(shared, rows, indices):
+            mask = (indices >= start) & (indices < stop)
+            return shared, rows[mask], indices[mask] - start
+        part.rgbas = [select(*arrays) for arrays in self.rgbas]
+        part.offsets = None if self.offsets is None else select(*self.offsets)
+        part.unique_offsets = self.unique_offsets
+        part.own_points = [(glyph, index - start) for glyph, index in self.own_points if start <= index < stop]
+        return part
+
+    def get_opacities(self) -> np.ndarray:
+        opacities = np.zeros(self.n_mobjects)
+        if self.rgbas:
+            shared, rows, indices = self.rgbas[0]
+            opacities[indices] = shared[rows, 3]
+        return opacities
+
+    def set_opacities(self, opacities: float | np.ndarray):
+        opacities = np.broadcast_to(np.asarray(opacities, dtype=float), (self.n_mobjects,))
+        for shared, rows, indices in self.rgbas:
+            shared[rows, 3] = opacities[indices]
+
+    def set_colors(self, rgbs: np.ndarray):
+        # fill and stroke colors as for set_color
+        rgbs = np.broadcast_to(np.asarray(rgbs, dtype=float), (self.n_mobjects, 3))
+        for shared, rows, indices in self.rgbas[:2]:
+            shared[rows, :3] = rgbs[indices]
+
+    def shift(self, vectors: np.ndarray):
+        # shift each mobject by its vector (or all of them by the same vector)
+        vectors = np.broadcast_to(np.asarray(vectors, dtype=float), (self.n_mobjects, 3))
+        shared, rows, indices = self.offsets
+        if self.unique_offsets:
+            shared[rows] += vectors[indices]
+        else:
+            np.add.at(shared, rows, vectors[indices])
+        for glyph, index in self.own_points:
+            glyph.shift(vectors[index])
+
+
+class RenderCache:
+    # Optional on-disk cache of the geometry DynamicCode extracts from Code so that re-running a scene
+    # skips text rendering and highlighting for DynamicCode constructions that have not changed.
+    # Entries are keyed by a hash of the Code args/kwargs (code string, tab_width, font, style, language, etc.).
+    # Each entry is a directory of compact .npy arrays plus a small json file.
+    # Least recently used entries are evicted once the cache grows past max_bytes.
+
+    version = 2
+
+    # attributes DynamicCode copies from Code
+    code_attrs = (
+        'tab_width', 'line_spacing', 'font_size', 'font', 'margin', 'indentation_chars', 'background',
+        'background_stroke_width', 'background_stroke_color', 'corner_radius', 'insert_line_no',
+        'line_no_from', 'line_no_buff', 'style', 'language',
+    )
+
+    def __init__(self, directory: str | None = None, max_bytes: int = 256 * 1024**2, enabled: bool = False):
+        # directory = None -> dynamic_code_cache in the manim media directory
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+    
+    def enable(self, directory: str | None = None, max_bytes: int | None = None):
+        if directory is not None:
+            self.directory = directory
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        self.enabled = True
+    
+    def disable(self):
+        self.enabled = False
+    
+    def get_directory(self) -> str:
+        if self.directory is None:
+            return os.path.join(config.media_dir, 'dynamic_code_cache')
+        return self.directory
+    
+    def key(self, args: tuple, kwargs: dict) -> str | None:
+        if not self.enabled:
+            return None
+        versions = [_package_version(package) for package in ('manim', 'pygments')]
+        payload = json.dumps([self.version, versions, args, kwargs], default=str, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    def put(self, key: str | None, dcode: 'DynamicCode'):
+        if key is None:
+            return
+        path = os.path.join(self.get_directory(), key)
+        if os.path.exists(path):
+            return
+        
+        background_leaves = dcode.background_mobject.family_members_with_points()
+        leaves = background_leaves + [glyph for line in [*dcode.line_numbers, *dcode.code] for glyph in line]
+        points = np.concatenate([leaf.points for leaf in leaves]).astype(np.float32)
+        counts = np.array([len(leaf.points) for leaf in leaves], dtype=np.int64)
+        styles = np.array([_leaf_style(leaf) for leaf in leaves], dtype=np.float32)
+        metrics = dcode._layout_metrics()
+        meta = {
+            'code_string': dcode.code_string,
+            'attrs': {attr: getattr(dcode, attr) for attr in self.code_attrs},
+            'default_color': dcode._default_color,
+            'n_background_leaves': len(background_leaves),
+            'line_number_sizes': [len(line) for line in dcode.line_numbers],
+            'line_sizes': [len(line) for line in dcode.code],
+            'code_origin_offset': dcode._code_origin_offset,
+            'gutter_origin_offset': getattr(dcode, '_gutter_origin_offset', None),
+            'gutter_right_offset': getattr(dcode, '_gutter_right_offset', None),
+            'metrics': {
+                **{name: float(value) for name, value in metrics.items() if name != 'glyph_offsets'},
+                'glyph_offsets': metrics['glyph_offsets'],
+            },
+        }
+
+        # write to a temporary directory first so a partially written entry is never read
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        os.makedirs(tmp_path, exist_ok=True)
+        np.save(os.path.join(tmp_path, 'points.npy'), points)
+        np.save(os.path.join(tmp_path, 'counts.npy'), counts)
+        np.save(os.path.join(tmp_path, 'styles.npy'), styles)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, default=lambda obj: obj.tolist() if isinstance(obj, np.ndarray) else str(obj))
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            # another process wrote the same entry first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self._evict()
+    
+    def restore(self, dcode: 'DynamicCode', key: str | None) -> bool:
+        # rebuild dcode from the cache entry for key, returns False if there is no such entry
+        if key is None:
+            return False
+        path = os.path.join(self.get_directory(), key)
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            # read whole, each leaf gets its own float copy of its points anyway
+            points = np.load(os.path.join(path, 'points.npy'))
+            counts = np.load(os.path.join(path, 'counts.npy'))
+            styles = np.load(os.path.join(path, 'styles.npy'))
+        except (OSError, ValueError):
+            return False
+        os.utime(path)  # mark as recently used
+        
+        leaves = []
+        stops = np.cumsum(counts)
+        for start, stop, style in zip(stops - counts, stops, styles):
+            leaves.append(_leaf_from_arrays(points[start:stop], style))
+        
+        n_background_leaves = meta['n_background_leaves']
+        dcode.background_mobject = leaves[0] if n_background_leaves == 1 else VGroup(*leaves[:n_background_leaves])
+        i = n_background_leaves
+        for attr, sizes in (('line_numbers', meta['line_number_sizes']), ('code', meta['line_sizes'])):
+            group = VGroup()
+            for size in sizes:
+                group.add(VGroup(*leaves[i:i+size]))
+                i += size
+            setattr(dcode, attr, group)
+        dcode.add(dcode.background_mobject, dcode.line_numbers, dcode.code)
+        dcode._add_grid_anchor()
+
+        for attr, value in meta['attrs'].items():
+            setattr(dcode, attr, value)
+        dcode._default_color = meta['default_color']
+        dcode.code_string = meta['code_string']
+        dcode._code_origin_offset = np.array(meta['code_origin_offset'])
+        if meta['gutter_origin_offset'] is not None:
+            dcode._gutter_origin_offset = np.array(meta['gutter_origin_offset'])
+            dcode._gutter_right_offset = meta['gutter_right_offset']
+        
+        # also skip measuring the layout metrics
+        metrics = _layout_metrics_cache.setdefault((dcode.font, dcode.font_size, dcode.line_spacing), {
+            **meta['metrics'], 'glyph_offsets': {},
+        })
+        for char, offset in meta['metrics']['glyph_offsets'].items():
+            metrics['glyph_offsets'].setdefault(char, np.array(offset))
+        return True
+    
+    def clear(self):
+        shutil.rmtree(self.get_directory(), ignore_errors=True)
+    
+    def _evict(self):
+        # drop least recently used entries until within max_bytes
+        directory = self.get_directory()
+        entries = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith('.tmp') or not os.path.isdir(path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path))
+            entries.append((os.path.getmtime(path), size, path))
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+render_cache = RenderCache()
+
+
+class Instrumentation:
+    # Opt-in timers and counters for DynamicCode's hot paths, disabled by default so they cost a single check.
+    # Timers (calls and total seconds) cover construction, planning, rearranging, committing, rendering,
+    # background resizing and player.play. Counters cover temporary Code and Text renders,
+    # glyphs created/moved/removed, points touched while rearranging and player.play calls.
+    # Hooks are called as hook(kind, name, value) for every measurement, kind is 'time' (seconds) or 'count',
+    # e.g. to forward them to your own metrics.
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.timers: dict[str, list] = {}  # name -> [calls, total seconds]
+        self.counters: dict[str, int] = {}
+        self.hooks = []
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.timers.clear()
+        self.counters.clear()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def count(self, name: str, n: int = 1):
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + n
+        for hook in self.hooks:
+            hook('count', name, n)
+
+    def add_time(self, name: str, seconds: float):
+        timer = self.timers.setdefault(name, [0, 0.0])
+        timer[0] += 1
+        timer[1] += seconds
+        for hook in self.hooks:
+            hook('time', name, seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed(self, name: str):
+        # decorator timing every call of a function
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.add_time(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def summary(self) -> str:
+        # readable report of all timers (slowest first) and counters, e.g. to print at the end of a scene
+        lines = [f"{'timer':<24} {'calls':>8} {'total ms':>12} {'mean ms':>10}"]
+        for name, (calls, total) in sorted(self.timers.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:<24} {calls:>8} {total * 1000:>12.2f} {total * 1000 / calls:>10.3f}")
+        lines.append(f"{'counter':<24} {'count':>8}")
+        for name, n in sorted(self.counters.items()):
+            lines.append(f"{name:<24} {n:>8}")
+        lines.append(f"{'glyph cache hits/misses':<24} {glyph_cache.hits:>8} / {glyph_cache.misses}")
+        return '\n'.join(lines)
+
+
+instrumentation = Instrumentation()
 
 
 class DynamicCode(VGroup):
+    @instrumentation.timed('construct')
     def __init__(self, *args, **kwargs):
         super().__init__()
+        
+        # viewport (see enable_viewport), None -> all lines are rendered
+        self._viewport_rows = None
+        self._scroll_row = 0  # first visible line
+        
+        self._revisions = None  # EditScript of revisions still to replay, see from_revisions
 
         if "file_name" in kwargs:
-            file_name = kwargs.pop("file_name")
-            tmp_code = Code(file_name=file_name)
-            kwargs["code"] = tmp_code.code_string
-            kwargs["language"] = tmp_code.language
+            # read the file directly rather than through a throwaway Code
+            document = CodeDocument.from_file(kwargs.pop("file_name"), language=kwargs.get("language", None))
+            kwargs["code"] = document.text.strip('\n')
+            kwargs["language"] = document.language
         elif "code" in kwargs:
             kwargs["code"] = kwargs["code"].strip('\n')
         
@@ -34,9 +577,17 @@ class DynamicCode(VGroup):
             kwargs["style"] = clone_attrs_from.style
             kwargs["language"] = clone_attrs_from.language
         
+        # reuse the geometry from a previous run if it is in the on-disk render cache
+        cache_key = render_cache.key(args, kwargs)
+        if render_cache.restore(self, cache_key):
+            self._share_outlines()
+            return
+        
         # use a Code mobject to generate everything
         # then extract the background, any line numbers, and code elements
-        tmp = Code(*args, **kwargs)
+        with instrumentation.timer('code_render'):
+            tmp = Code(*args, **kwargs)
+        instrumentation.count('code_renders')
         self.background_mobject = tmp.background_mobject
         if hasattr(tmp, 'line_numbers'):
             self.line_numbers = tmp.line_numbers
@@ -44,7 +595,6 @@ class DynamicCode(VGroup):
         else:
             self.line_numbers = VGroup()
         self.code = remove_invisible_chars(tmp.code)
-        self.code_string = tmp.code_string
         tmp.remove(tmp.background_mobject, tmp.code)
         self.add(self.background_mobject, self.line_numbers, self.code)
 
@@ -64,6 +614,12 @@ class DynamicCode(VGroup):
         self.line_no_buff = tmp.line_no_buff
         self.style = tmp.style
         self.language = tmp.language
+        self._default_color = tmp.default_color
+        self.code_string = tmp.code_string
+
+        self._init_layout()
+        render_cache.put(cache_key, self)
+        self._share_outlines()
 
         # super().__init__(*args, **kwargs)
         # self.code = remove_invisible_chars(self.code)
@@ -78,37 +634,99 @@ class DynamicCode(VGroup):
         #         self.remove(mobj)
         #         break
     
-    def set_background_width(self, width: float | str = 'auto'):
+    def set_background_width(self, width: float | str = 'auto', **kwargs):
         # width = 'auto' -> fit to code width
-        self.set_background_size(width=width, height=None)
+        self.set_background_size(width=width, height=None, **kwargs)
     
-    def set_background_height(self, height: float | str = 'auto'):
+    def set_background_height(self, height: float | str = 'auto', **kwargs):
         # height = 'auto' -> fit to code height
-        self.set_background_size(width=None, height=height)
+        self.set_background_size(width=None, height=height, **kwargs)
     
-    def set_background_size(self, width: float | str = None, height: float | str = None):
-        if width is None and height is None:
+    @instrumentation.timed('set_background_size')
+    def set_background_size(self, width: float | str = None, height: float | str = None, **kwargs):
+        # if player is supplied, then play the resize animation
+        # otherwise just resize the background instantly
+        player: Scene = kwargs.pop('player', None)
+        if player is not None:
+            self._play(player, ResizeBackground(self, width, height, **kwargs))
             return
+        
+        for mobject, offsets in self._background_resize_offsets(width, height):
+            mobject.points += offsets
+    
+    def _background_resize_offsets(self, width: float | str = None, height: float | str = None) -> list[tuple[VMobject, np.ndarray]]:
+        # Offsets for the points of the background's rectangle that resize it to width x height with its top left
+        # corner at the grid anchor (see _init_layout). The rounded rectangle is rebuilt from corner_radius at the
+        # new size, so the corners keep their shape however small it gets. Points of rounded rectangles of the same
+        # radius are linear in the size, so interpolating the offsets (see ResizeBackground) resizes it smoothly.
+        # Any other parts of the background (e.g. the window buttons at the top left) stay where they are.
+        if width is None and height is None:
+            return []
         if width == 'auto' or height == 'auto':
             x, y, w, h = self.get_code_bbox()
             if width == 'auto':
                 width = w
             if height == 'auto':
                 height = h
-        bg = self.background_mobject
-        mins = bg.points.min(axis=0)
-        maxs = bg.points.max(axis=0)
-        mids = (mins + maxs) / 2
-        sizes = maxs - mins
-        if width is not None:
-            dw = width - sizes[0]
-        if height is not None:
-            dh = height - sizes[1]
-        for i, pt in enumerate(bg.points):
-            if width is not None and pt[0] > mids[0]:
-                pt[0] += dw
-            if height is not None and pt[1] < mids[1]:
-                pt[1] -= dh
+        rect = self.background_mobject.family_members_with_points()[0]
+        if width is None:
+            width = rect.width
+        if height is None:
+            height = rect.height
+        radius = min(self.corner_radius, width / 2, height / 2)
+        target = RoundedRectangle(corner_radius=radius, width=width, height=height)
+        target.shift(self._grid_anchor.get_location() - target.get_corner(UL))
+        if len(target.points) != len(rect.points):
+            # e.g. a background built by a different construction or a radius of 0
+            rect.align_points(target)
+        return [(rect, target.points - rect.points)]
+    
+    @property
+    def code_string(self) -> str:
+        return self.document.text
+    
+    @code_string.setter
+    def code_string(self, code_string: str):
+        self.document = CodeDocument(code_string, language=self.language, style=self.style, default_color=self._default_color)
+    
+    def get_lines(self) -> list[str]:
+        # lines of code (a cleared listing has no lines)
+        return self.document.lines if len(self.code) > 0 else []
+    
+    def glyphs_at(self, start: int | tuple[int, int], stop: int | tuple[int, int] = None) -> VGroup:
+        # Glyphs for the code between positions start and stop, positions are as for remove_code.
+        # stop = None -> end of the start line
+        # Glyphs of lines out of the viewport are rendered in their cells but not added to the code,
+        # so those lines stay text only (see enable_viewport).
+        lines = self.get_lines()
+        start_line_index, start_char_index = CodeDocument.get_char_pos(start, lines)
+        if stop is None:
+            stop_line_index, stop_char_index = start_line_index, len(lines[start_line_index])
+        else:
+            stop_line_index, stop_char_index = CodeDocument.get_char_pos(stop, lines)
+        if stop_line_index >= len(lines):
+            stop_line_index, stop_char_index = len(lines) - 1, len(lines[-1])
+        line_indices = range(start_line_index, stop_line_index + 1)
+        self._materialize([line_index for line_index in line_indices if self._in_viewport(line_index)])
+        line_glyphs = {line_index: self.code[line_index].submobjects for line_index in line_indices}
+        detached_line_indices = [line_index for line_index in line_indices if not self._is_materialized(line_index)]
+        if detached_line_indices:
+            colors = self.document.get_line_colors()
+            line_vgroups = self._render_rows(
+                detached_line_indices, [lines[line_index] for line_index in detached_line_indices],
+                [colors[line_index] for line_index in detached_line_indices], len(lines),
+            )
+            for line_index, line_vgroup in zip(detached_line_indices, line_vgroups):
+                line_glyphs[line_index] = line_vgroup.submobjects
+        a = self.document.glyph_index(start_line_index, start_char_index)
+        b = self.document.glyph_index(stop_line_index, stop_char_index)
+        if start_line_index == stop_line_index:
+            return VGroup(*line_glyphs[start_line_index][a:b])
+        glyphs = line_glyphs[start_line_index][a:]
+        for line_index in range(start_line_index + 1, stop_line_index):
+            glyphs.extend(line_glyphs[line_index])
+        glyphs.extend(line_glyphs[stop_line_index][:b])
+        return VGroup(*glyphs)
     
     def get_code_bbox(self, line_slice: slice = slice(None, None)) -> tuple[float, float]:
         foreground = VGroup(*self.code[line_slice])
@@ -128,351 +746,922 @@ class DynamicCode(VGroup):
     def insert_code(self, pos: int | tuple[int | None, int | None] | None, code: str, opacity: float = 1, **kwargs):
         # if player is supplied, then play the insertion animations
         # otherwise just update the code instantly
+        return self.edit_code([(pos, pos, code)], opacity=opacity, **kwargs)
+    
+    def remove_code(self, start: int | tuple[int, int] = (0, 0), stop: int | tuple[int, int] = None, **kwargs):
+        if start == (0, 0) and stop is None:
+            self.clear_code()
+            return
+        
+        # if player is supplied, then play the removal animations
+        # otherwise just update the code instantly
+        self.edit_code([(start, stop, '')], **kwargs)
+    
+    def replace_range(self, start: int | tuple[int, int], stop: int | tuple[int, int], code: str, **kwargs):
+        # replace the code between positions start and stop (as for remove_code) with code
+        return self.edit_code([(start, stop, code)], **kwargs)
+    
+    def replace(self, pattern: str | re.Pattern, repl, count: int | None = None, flags: int = 0, **kwargs):
+        # Replace the first count (None -> all) matches of the regex pattern with repl (as for re.sub) in a single
+        # batch edit, so all sites are laid out once and, if animated, change at the same time.
+        # Pass start and/or stop positions to only replace matches in that range of the code.
+        start = kwargs.pop('start', (0, 0))
+        stop = kwargs.pop('stop', None)
+        edits = self.document.replace_edits(pattern, repl, count=count, flags=flags, start=start, stop=stop)
+        if not edits:
+            return VGroup()
+        return self.edit_code(edits, **kwargs)
+    
+    @instrumentation.timed('edit_code')
+    def edit_code(self, edits: list[tuple], opacity: float = 1, **kwargs) -> VGroup:
+        # Apply several edits in a single layout pass (and a single animation if player is supplied).
+        # Each edit is (start, stop, code) and replaces the code between positions start and stop with code,
+        # e.g. insert: (pos, pos, code), remove: (start, stop, ''). Positions are as for insert_code/remove_code
+        # and all refer to the code before any of the edits are applied. Edits may not overlap.
         player: Scene = kwargs.pop('player', None)
         if player is not None:
-            run_time = kwargs.pop('run_time', 1)
-            lag_ratio = kwargs.pop('lag_ratio', 0.1)
-            rt0 = min(0.5, run_time/2)
-            rt1 = run_time - rt0
-            pre_animation_mobjects = player.mobjects.copy()
-            player.play(self.animate(run_time=rt0).insert_code(pos, code, rearrange_only=True, **kwargs))
-            inserted_glyphs = self.insert_code(pos, code, opacity=0, **kwargs)
-            player.play(inserted_glyphs.animate(run_time=rt1, lag_ratio=lag_ratio).set_opacity(opacity))
-            post_animation_mobjects = player.mobjects.copy()
-            
-            # !!! Because the final animation creates new mobjects which make the prior references to these mobjects invalid.
-            #     In addition, new mobjects are added to both player.mobjects and groups in player.pre_animation_mobjects
-            #     which makes it difficult to remove these mobjects later as they must be removed from multiple groups.
-            #     Totally crazy behavior to be sure, but as far as I can tell that's how it is for now.
-            
-            # The newly animated inserted glyphs appear to be in a group which is the last mobject in player.mobjects.
-            # No idea how reliable this is, but it seems to work.
-            new_glyphs = player.mobjects[-1]
-
-            # Replace references to glyphs in self.code with references to the animated glyphs that replaced them.
-            for i in range(len(self.code)):
-                for j in range(len(self.code[i])):
-                    for k in range(len(inserted_glyphs)):
-                        if self.code[i][j] is inserted_glyphs[k]:
-                            self.code[i][j] = new_glyphs[k]
-                            break
-            
-            # The animation polluted player.mobjects with all sorts of extra objects and groups of objects which are not needed
-            # as they are already in self. To clean up the scene heirarchy we need to remove these extra references.
-            player.mobjects = pre_animation_mobjects
-            return
+            return self._play_edits(player, edits, opacity=opacity, **kwargs)
         
-        if len(self.code) > 0:
-            lines = self.code_string.strip('\n').split('\n')
-        else:
-            lines = []
+        plan = self.plan_edits(edits, opacity=opacity, **kwargs)
+        self._rearrange(plan)
+        return self.commit_edits(plan)
+    
+    def edits(self, **kwargs) -> 'CodeEdits':
+        # Collect edits in a with block and apply them all at once on exit, kwargs are as for edit_code.
+        #   with dcode.edits(player=self, run_time=1) as edits:
+        #       edits.insert_code((3, 0), 'import os\n')
+        #       edits.remove_code((5, 4), (5, 7))
+        return CodeEdits(self, **kwargs)
 
-        line_index, char_index = self._get_char_pos(pos, lines)
+    @classmethod
+    def from_revisions(cls, revisions: list, prerender: bool = False, **kwargs) -> 'DynamicCode':
+        # A DynamicCode showing the first of revisions, see replay_revisions. Revisions are code strings or files
+        # given as paths (os.PathLike, e.g. pathlib.Path), a str is always code even if it happens to name a file.
+        # Files are read directly (each path once) and the language is guessed from the first file name if not given.
+        # prerender = True -> render the glyphs for all revisions in a process pool (see EditScript.prerender).
+        texts = []
+        read = {}  # path -> text
+        for revision in revisions:
+            if isinstance(revision, os.PathLike):
+                path = os.fspath(revision)
+                if path not in read:
+                    document = CodeDocument.from_file(path, language=kwargs.get('language', None))
+                    kwargs.setdefault('language', document.language)
+                    read[path] = document.text
+                revision = read[path]
+            texts.append(revision.strip('\n'))
+        dcode = cls(code=texts[0], **kwargs)
+        dcode._revisions = dcode.edit_script(texts[1:])
+        if prerender:
+            dcode._revisions.prerender()
+        return dcode
+    
+    def replay_revisions(self, **kwargs):
+        # Step through the remaining revisions given to from_revisions, kwargs are as for set_code.
+        # Consecutive revisions are diffed so only the changed code is edited, and repeated revisions are skipped.
+        if self._revisions is not None:
+            self._revisions.play(**kwargs)
+            self._revisions = None
+    
+    def __deepcopy__(self, memo):
+        # Copies (e.g. for .animate, Transform or Write) leave out the revisions still to replay,
+        # whose prerender jobs cannot be copied and belong to this DynamicCode anyway.
+        if self._revisions is not None:
+            memo[id(self._revisions)] = None
+        cls = self.__class__
+        result = cls.__new__(cls)
+        memo[id(self)] = result
+        for name, value in self.__dict__.items():
+            result.__dict__[name] = copy.deepcopy(value, memo)
+        return result
+    
+    def edit_script(self, steps: list) -> 'EditScript':
+        # A known sequence of edits whose glyphs can be rendered ahead of time, see EditScript.
+        #   script = dcode.edit_script([[((0, 0), (0, 0), 'import os\n')], new_code]).prerender()
+        #   script.play(player=self, run_time=1)
+        return EditScript(self, steps)
+    
+    def stream(self, chunks, chars_per_second: float = 30, **kwargs):
+        # Append chunks of code (any iterable of strings, e.g. a generator or an open file) as if they were typed.
+        # Chunks are consumed lazily, batch_time seconds of typing at a time, and each batch is laid out as one edit.
+        # If player is supplied, each batch is a single StreamCode animation revealing glyphs as their chars are typed,
+        # otherwise the code is just appended instantly.
+        # With the viewport enabled (see enable_viewport), the code scrolls to keep the last line in view, so only the
+        # lines in view ever have glyphs however much code has been streamed.
+        player: Scene = kwargs.pop('player', None)
+        batch_time: float = kwargs.pop('batch_time', 1)
+        scroll_time: float = kwargs.pop('scroll_time', 0.2)
+        kwargs.pop('run_time', None)  # set by chars_per_second
+        batch_chars = max(int(chars_per_second * batch_time), 1)
+        batch = []
+        n_chars = 0
+        for chunk in chunks:
+            batch.append(chunk)
+            n_chars += len(chunk)
+            if n_chars >= batch_chars:
+                self._stream_batch(''.join(batch), player, chars_per_second, scroll_time, **kwargs)
+                batch = []
+                n_chars = 0
+        if batch:
+            self._stream_batch(''.join(batch), player, chars_per_second, scroll_time, **kwargs)
 
-        pre_lines = lines[:line_index]
-        post_lines = lines[line_index:]
-        if len(post_lines) > 0:
-            insertion_line = post_lines.pop(0)
-        else:
-            insertion_line = ''
-        pre_insert_string = insertion_line[:char_index]
-        post_insert_string = insertion_line[char_index:]
-
-        new_lines = (pre_insert_string + code + post_insert_string).split('\n')
-
-        if code.startswith('\n') and char_index == len(insertion_line):
-            pre_lines.append(new_lines.pop(0))
-            insertion_line_changed = False
-        elif code.endswith('\n') and char_index == 0:
-            post_lines.insert(0, new_lines.pop(-1))
-            insertion_line_changed = False
-        else:
-            insertion_line_changed = True
-        
-        if insertion_line_changed:
-            # ignore whitespace to match glyph indices
-            n_pre_insert_glyphs = len(re.sub(r'\s+', '', pre_insert_string))
-            n_post_insert_glyphs = len(re.sub(r'\s+', '', post_insert_string))
-            if n_pre_insert_glyphs:
-                pre_insert_glyphs = self.code[line_index][:n_pre_insert_glyphs]
-            if n_post_insert_glyphs:
-                post_insert_glyphs = self.code[line_index][n_pre_insert_glyphs:]
-        
-        combined_lines = pre_lines + new_lines + post_lines
-        combined_code = '\n'.join(combined_lines)
-
-        tmp = DynamicCode(code=combined_code, clone_attrs_from=self)
-        tmp.align_to(self, direction=UL)
-
-        # if tmp.code.get_edge_center(UP)[1] < self.code.get_edge_center(UP)[1]:
-        #     # in case self.code is scrolled up above background
-        #     tmp.code.align_to(self.code, direction=UP)
-        #     if self.insert_line_no:
-        #         tmp.line_numbers.align_to(self.line_numbers, direction=UP)
-
-        # create space for insertion
+    def _stream_batch(self, text: str, player: Scene | None, chars_per_second: float, scroll_time: float, **kwargs):
+        if not text:
+            return
+        if player is None:
+            self.append_code(text, **kwargs)
+            if self._viewport_rows is not None:
+                self.scroll_to(max(self._scroll_row, len(self.document.lines) - self._viewport_rows))
+            return
+
+        # split the text before each new line that has to be scrolled into view
+        pieces = [(None, '')]  # (scroll_row or None, text)
+        row = max(len(self.get_lines()) - 1, 0)
+        first_visible_row = self._scroll_row
+        for i, line in enumerate(text.split('\n')):
+            scroll_row, piece = pieces[-1]
+            if i > 0:
+                row += 1
+                if self._viewport_rows is not None and row >= first_visible_row + self._viewport_rows:
+                    first_visible_row = row - self._viewport_rows + 1
+                    pieces.append((first_visible_row, ''))
+                    scroll_row, piece = pieces[-1]
+                piece += '\n'
+            pieces[-1] = (scroll_row, piece + line)
+
+        for scroll_row, piece in pieces:
+            if scroll_row is not None:
+                self._play_animations(player, ScrollCode(self, scroll_row, run_time=scroll_time))
+            if piece:
+                self._play_animations(player, StreamCode(self, piece, chars_per_second=chars_per_second, **kwargs))
+
+    def _play_edits(self, player: Scene, edits: list[tuple], opacity: float = 1, **kwargs) -> VGroup:
+        animation = EditCode(self, edits, opacity=opacity, **kwargs)
+        self._play_animations(player, animation)
+        return animation.inserted_glyphs
+    
+    def _play_animations(self, player: Scene, *animations):
+        # every player.play issued by DynamicCode, so they are counted and timed (see Instrumentation)
+        instrumentation.count('plays')
+        with instrumentation.timer('play'):
+            player.play(*animations)
+    
+    def _play(self, player: Scene, *animations):
+        # Play animations and clean up the scene afterwards.
+        pre_animation_mobjects = player.mobjects.copy()
+        self._play_animations(player, *animations)
+        
+        # The animation polluted player.mobjects with all sorts of extra objects and groups of objects which are not needed
+        # as they are already in self. To clean up the scene heirarchy we need to remove these extra references.
+        if self in player.mobjects and self not in pre_animation_mobjects:
+            # the animation added self to the scene
+            pre_animation_mobjects.append(self)
+        player.mobjects = pre_animation_mobjects
+    
+    @instrumentation.timed('plan_edits')
+    def plan_edits(self, edits: list[tuple], opacity: float = 1, **kwargs) -> 'EditPlan':
+        # Lay out edits (see edit_code) without changing the code. The plan holds where existing glyphs and
+        # line numbers move to, which of them are removed, and the rendered new glyphs and line numbers.
+        # It is consumed by the rearrangement (animated or not, see RearrangeCode) and then by the commit.
+        # Only the lines touched by the edits are rendered. All other glyphs keep their geometry and are
+        # simply moved to their new (row, column) cells on the monospace grid.
         autosize: bool = kwargs.pop('autosize', False)
         autowidth: bool = kwargs.pop('autowidth', False)
         autoheight: bool = kwargs.pop('autoheight', False)
-        if autosize:
-            self.set_background_size(tmp.background_mobject.width, tmp.background_mobject.height)
-        elif autowidth:
-            self.set_background_width(tmp.background_mobject.width)
-        elif autoheight:
-            self.set_background_height(tmp.background_mobject.height)
+        color = kwargs.pop('color', None)
+        recolor: bool = kwargs.pop('recolor', True)
+
+        if len(self.code) == 0:
+            # an empty listing still has an (empty) line to insert into
+            self.code.add(VGroup())
+            self.code_string = ''
+        lines = self.document.lines
+        edits = self.document.resolve_edits(edits)
+        plan = EditPlan()
+        plan.scroll_row = self._scroll_row
+        old_colors = self.document.get_line_colors()
+        # glyphs are gathered in lists and the plan's groups are built once at the end
+        hidden, shown, entering, inserted_glyphs = [], [], [], []
         
-        if self.insert_line_no:
-            # in case max number of digits in all line numbers changes
-            if len(self.code):
-                self.code.align_to(tmp.code, direction=LEFT)
+        # Kept parts of the first and last lines of each edit need glyphs even if they are out of view.
+        # They are rendered hidden and faded in if they end up in view.
+        faded_in_line_indices = set(self._materialize({line_index for start, stop, code in edits for line_index in (start[0], stop[0])}, opacity=0))
         
-        if insertion_line_changed and n_post_insert_glyphs > 0:
-            # move post split glyphs to their new positions
-            post_insert_glyphs.move_to(tmp.code[len(pre_lines)+len(new_lines)-1][-n_post_insert_glyphs:])
+        # Split the new code into rows. Runs of untouched lines are ('lines', start_line_index, stop_line_index),
+        # and edited rows are lists of fragments ('old', line_index, start_char_index, stop_char_index) or ('new', string).
+        rows = [[]]
+        def add_old_code(start_line_index, start_char_index, stop_line_index, stop_char_index):
+            if start_line_index == stop_line_index:
+                rows[-1].append(('old', start_line_index, start_char_index, stop_char_index))
+                return
+            rows[-1].append(('old', start_line_index, start_char_index, len(lines[start_line_index])))
+            if stop_line_index - start_line_index > 1:
+                rows.append(('lines', start_line_index + 1, stop_line_index))
+            rows.append([('old', stop_line_index, 0, stop_char_index)])
+        cursor = (0, 0)
+        for start, stop, code in edits:
+            add_old_code(*cursor, *start)
+            for i, new_line in enumerate(code.split('\n')):
+                if i > 0:
+                    rows.append([])
+                rows[-1].append(('new', new_line))
+            cursor = stop
+        add_old_code(*cursor, len(lines) - 1, len(lines[-1]))
+
+        # glyphs that are not kept in any of the rows
+        for (start_line_index, start_char_index), (stop_line_index, stop_char_index), code in edits:
+            n_start_glyphs = self.document.glyph_index(start_line_index, start_char_index)
+            n_stop_glyphs = self.document.glyph_index(stop_line_index, stop_char_index)
+            if start_line_index == stop_line_index:
+                hidden.extend(self.code[start_line_index].submobjects[n_start_glyphs:n_stop_glyphs])
+            else:
+                hidden.extend(self.code[start_line_index].submobjects[n_start_glyphs:])
+                for i in range(start_line_index + 1, stop_line_index):
+                    hidden.extend(self.code[i].submobjects)
+                hidden.extend(self.code[stop_line_index].submobjects[:n_stop_glyphs])
         
-        if insertion_line_changed and n_pre_insert_glyphs > 0:
-            # move pre split glyphs in case the new code slightly alters their vertical position
-            pre_insert_glyphs.align_to(tmp.code[len(pre_lines)][:n_pre_insert_glyphs], UP)
+        n_new_lines = sum(row[2] - row[1] if isinstance(row, tuple) else 1 for row in rows)
+        if edits:
+            old_stop_row = edits[-1][1][0] + 1
+            plan.changed_rows = (edits[0][0][0], old_stop_row, old_stop_row + n_new_lines - len(lines))
+
+        # the code shifts horizontally if the number of digits in the line numbers changes
+        gutter_changed = self._gutter_width(n_new_lines) != self._gutter_width(len(lines))
+
+        # Plan the new lines and the moves of kept glyphs to their new cells.
+        # Runs of untouched lines stay a single slice of the old lines throughout, so that the cost of planning
+        # and committing depends on the lines touched by the edits (and the viewport) rather than on all lines.
+        line_plans = []  # (line_index, old_line_index or None, existing line vgroup or None, [glyphs or (first_glyph_index, n_new_glyphs), ...] or None -> unchanged, index in plan.line_plans)
+        blocks = []  # (line_index, start_line_index, stop_line_index) of runs of untouched lines
+        line_plan_starts = []  # first line index of each of plan.line_plans
+        edited_line_indices = []  # rows spliced together by the edits (even if they end up as an untouched line)
+        claimed_line_indices = set()
+        for row in rows:
+            line_index = len(plan.lines)
+            line_plan_starts.append(line_index)
+            if isinstance(row, tuple):
+                block_start, block_stop = row[1:]
+                if gutter_changed or line_index != block_start:
+                    # only lines with glyphs move, i.e. lines in view (see enable_viewport)
+                    moved = self._rows_in_viewport(block_start, block_stop)
+                    if moved:
+                        moved_lines = self.code[moved.start:moved.stop]
+                        plan.add_move(moved_lines, self._lines_shift(moved_lines, lines[moved.start:moved.stop], line_index + moved.start - block_start, n_new_lines))
+                plan.lines.extend(lines[block_start:block_stop])
+                plan.glyph_counts.extend(self.document.glyph_counts[block_start:block_stop])
+                plan.line_colors.extend(old_colors[block_start:block_stop])
+                plan.safe_lines.extend(self.document.safe_lines[block_start:block_stop])
+                blocks.append((line_index, block_start, block_stop))
+                plan.line_plans.append(slice(block_start, block_stop))
+                continue
+            plan.line_plans.append(None)  # see below
+            
+            # drop empty fragments
+            fragments = [fragment for fragment in row if (fragment[1] if fragment[0] == 'new' else fragment[2] < fragment[3])]
+            new_line = ''.join(
+                lines[fragment[1]][fragment[2]:fragment[3]] if fragment[0] == 'old' else fragment[1] for fragment in row
+            )
+            if any(fragment[0] == 'new' for fragment in row):
+                edited_line_indices.append(line_index)
+            plan.lines.append(new_line)
+            plan.glyph_counts.append(None)
+            plan.line_colors.append([])
+            plan.safe_lines.append(None)
+            if len(fragments) == 1 and fragments[0][0] == 'old' and fragments[0][2] == 0 and fragments[0][3] == len(lines[fragments[0][1]]) and fragments[0][1] not in claimed_line_indices:
+                # untouched line
+                old_line_index = fragments[0][1]
+                claimed_line_indices.add(old_line_index)
+                plan.glyph_counts[-1] = self.document.glyph_counts[old_line_index]
+                plan.line_colors[-1] = old_colors[old_line_index]
+                plan.safe_lines[-1] = self.document.safe_lines[old_line_index]
+                if gutter_changed or line_index != old_line_index:
+                    plan.add_move(self.code[old_line_index], self._lines_shift(self.code[old_line_index:old_line_index+1], [new_line], line_index, n_new_lines))
+                line_plans.append((line_index, old_line_index, self.code[old_line_index], None, len(plan.line_plans) - 1))
+                continue
+            
+            line_vgroup = None
+            parts = []
+            n_glyphs = 0
+            for fragment in fragments:
+                if fragment[0] == 'old':
+                    old_line_index, start_char_index, stop_char_index = fragment[1:]
+                    a = self.document.glyph_index(old_line_index, start_char_index)
+                    b = self.document.glyph_index(old_line_index, stop_char_index)
+                    glyphs = self.code[old_line_index][a:b]
+                    for glyph, shift in zip(glyphs, self._glyph_shifts(glyphs, new_line, line_index, n_glyphs, n_new_lines)):
+                        plan.add_move(glyph, shift)
+                    parts.append(glyphs.submobjects)
+                    plan.line_colors[-1].extend(old_colors[old_line_index][a:b])
+                    if old_line_index in faded_in_line_indices and self._in_viewport(line_index):
+                        shown.extend(glyphs.submobjects)
+                    if line_vgroup is None and old_line_index not in claimed_line_indices:
+                        # keep the line's group so outside references to it remain valid
+                        claimed_line_indices.add(old_line_index)
+                        line_vgroup = self.code[old_line_index]
+                    n_glyphs += b - a
+                else:
+                    n_new_glyphs = CodeDocument.count_glyphs(fragment[1])
+                    parts.append((n_glyphs, n_new_glyphs))
+                    plan.line_colors[-1].extend([None] * n_new_glyphs)
+                    n_glyphs += n_new_glyphs
+            line_plans.append((line_index, None, line_vgroup, parts, len(plan.line_plans) - 1))
         
-        # shift pre lines up in case the new code slightly alters their vertical position
-        if len(pre_lines) > 0:
-            self.code[:len(pre_lines)].align_to(tmp.code, direction=UP)
+        # Re-highlight from the last line before each edited line where the lexer is in its initial state
+        # until it is back in sync with the old highlighting. old colors are None for new glyphs.
+        old_line_colors = list(plan.line_colors)
+        relexed_rows = []
+        with instrumentation.timer('relex'):
+            for line_index in edited_line_indices:
+                if not relexed_rows or line_index >= relexed_rows[-1][1]:
+                    relexed_rows.append(self.document.relex(plan.lines, plan.line_colors, plan.safe_lines, line_index))
         
-        # shift post lines down to their new positions
-        if len(post_lines) > 0:
-            self.code[-len(post_lines):].align_to(tmp.code, direction=DOWN)
+        size = self._autosize_background(plan.lines, autosize=autosize, autowidth=autowidth, autoheight=autoheight)
+        if size is not None:
+            plan.background = [
+                (mobject, mobject.points.copy(), offsets)
+                for mobject, offsets in self._background_resize_offsets(*size)
+            ]
         
-        if kwargs.pop('rearrange_only', False):
-            return
-
-        # extract new lines from tmp
-        start_line_index = len(pre_lines)
-        stop_line_index = start_line_index + len(new_lines)
-        new_line_vgroups = tmp.code[start_line_index:stop_line_index]
-        tmp.code.remove(*new_line_vgroups)
-        new_line_vgroups.set_opacity(opacity)
+        # Lines moving out of the viewport are faded out and dropped, and lines moving into view are rendered.
+        # Edited lines out of view keep no glyphs at all.
+        entering_lines = []  # (line_index, line vgroup)
+        def plan_view(line_index, old_line_index, line_vgroup):
+            in_view = self._in_viewport(line_index)
+            if in_view and old_line_index in faded_in_line_indices:
+                shown.extend(line_vgroup.submobjects)
+            elif in_view and not self._is_materialized(old_line_index):
+                entering_lines.append((line_index, line_vgroup))
+            elif not in_view and len(line_vgroup):
+                hidden.extend(line_vgroup.submobjects)
+                plan.dematerialized.append(line_vgroup)
+        for line_index, old_line_index, line_vgroup, parts, k in line_plans:
+            if parts is None:
+                plan_view(line_index, old_line_index, line_vgroup)
+            elif not self._in_viewport(line_index):
+                for part in parts:
+                    if not isinstance(part, tuple):
+                        hidden.extend(part)
+        if self._viewport_rows is not None:
+            # only lines of untouched runs that are in view before or after the edits can change
+            for line_index, block_start, block_stop in blocks:
+                shift = line_index - block_start
+                in_view = {*self._rows_in_viewport(block_start, block_stop), *self._rows_in_viewport(block_start, block_stop, shift)}
+                for old_line_index in sorted(in_view):
+                    plan_view(old_line_index + shift, old_line_index, self.code[old_line_index])
+        
+        # render only the lines in view with new glyphs, and the lines moving into view
+        rendered_line_indices = [
+            line_index for line_index, old_line_index, line_vgroup, parts, k in line_plans
+            if parts is not None and self._in_viewport(line_index) and any(isinstance(part, tuple) and part[1] > 0 for part in parts)
+        ]
+        entering_line_indices = [line_index for line_index, line_vgroup in entering_lines]
+        rendered_line_vgroups = {}
+        if rendered_line_indices or entering_line_indices:
+            line_indices = rendered_line_indices + entering_line_indices
+            line_vgroups = self._render_rows(
+                line_indices, [plan.lines[line_index] for line_index in line_indices],
+                [plan.line_colors[line_index] for line_index in line_indices], n_new_lines,
+            )
+            rendered_line_vgroups = dict(zip(line_indices, line_vgroups))
+        for line_index, line_vgroup in entering_lines:
+            glyphs = rendered_line_vgroups[line_index]
+            plan.materialized.append((line_vgroup, glyphs.submobjects))
+            entering.extend(glyphs.submobjects)
+        plan.entering = VGroup(*entering)
+        plan.entering.set_opacity(0)
+        shown.extend(entering)
+        
+        # glyphs of the new lines, glyphs rendered for kept parts of edited lines are dropped
+        # in favor of the existing glyphs which will already be in place
+        for line_index, old_line_index, line_vgroup, parts, k in line_plans:
+            if parts is not None:
+                glyphs = []
+                if self._in_viewport(line_index):
+                    for part in parts:
+                        if isinstance(part, tuple):
+                            new_glyphs = rendered_line_vgroups[line_index].submobjects[part[0]:part[0]+part[1]] if part[1] else []
+                            inserted_glyphs.extend(new_glyphs)
+                            plan.inserted_glyph_locations.extend((line_index, len(glyphs) + i) for i in range(len(new_glyphs)))
+                            glyphs.extend(new_glyphs)
+                        else:
+                            glyphs.extend(part)
+                parts = glyphs
+            plan.line_plans[k] = (line_vgroup, parts)
+        plan.inserted_glyphs = VGroup(*inserted_glyphs)
+        plan.inserted_glyphs.set_opacity(opacity)
+        
+        # recolor existing glyphs whose highlighting changed
+        if recolor:
+            for start_row, stop_row in relexed_rows:
+                for row in range(start_row, stop_row):
+                    k = bisect_right(line_plan_starts, row) - 1
+                    line_plan = plan.line_plans[k]
+                    if isinstance(line_plan, slice):
+                        glyphs = self.code[line_plan.start + row - line_plan_starts[k]].submobjects
+                    else:
+                        line_vgroup, glyphs = line_plan
+                        if glyphs is None:
+                            glyphs = line_vgroup.submobjects
+                    for glyph, old_color, new_color in zip(glyphs, old_line_colors[row], plan.line_colors[row]):
+                        if old_color is not None and old_color != new_color:
+                            plan.recolored.append((glyph, old_color, new_color))
 
         # color new glyphs?
-        color = kwargs.pop('color', None)
         if color is not None:
-            new_line_vgroups.set_color(color)
-
-        # extract post split glyphs from self if needed
-        if insertion_line_changed and n_post_insert_glyphs > 0:
-            self.code[start_line_index].remove(*post_insert_glyphs)
-        
-        # insert extracted new lines into self
-        inserted_glyphs = VGroup()
-        for i, new_line_vgroup in enumerate(new_line_vgroups):
-            line_index = start_line_index + i
-            if i == 0 and insertion_line_changed and len(self.code) > line_index:
-                # extract new glyphs from tmp and append to existing line in self
-                new_glyphs_to_append = new_line_vgroup[n_pre_insert_glyphs:]
-                if len(new_glyphs_to_append) > 0:
-                    new_line_vgroup.remove(*new_glyphs_to_append)
-                    self.code[line_index].add(*new_glyphs_to_append)
-                    inserted_glyphs.add(*new_glyphs_to_append)
-            elif i == len(new_line_vgroups) - 1 and insertion_line_changed and n_post_insert_glyphs > 0:
-                # replace end of new line with extracted post split glyphs
-                new_glyphs_to_be_replaced_with_existing_ones = new_line_vgroup[-n_post_insert_glyphs:]
-                new_line_vgroup.remove(*new_glyphs_to_be_replaced_with_existing_ones)
-                new_line_vgroup.add(*post_insert_glyphs)
-                self.code.insert(line_index, new_line_vgroup)
-                inserted_glyphs.add(*new_line_vgroup[:-n_post_insert_glyphs])
-            else:
-                self.code.insert(line_index, new_line_vgroup)
-                inserted_glyphs.add(*new_line_vgroup[:])
+            plan.inserted_glyphs.set_color(color)
         
         if self.insert_line_no:
             n_old_line_numbers = len(self.line_numbers)
-            n_new_line_numbers = len(tmp.line_numbers)
-            if n_new_line_numbers > n_old_line_numbers:
-                # extract new line numbers from tmp and insert into self
-                new_line_numbers = tmp.line_numbers[n_old_line_numbers:]
-                tmp.line_numbers.remove(*new_line_numbers)
-                self.line_numbers.add(*new_line_numbers)
+            for number_vgroup in self.line_numbers[n_new_lines:]:
+                hidden.extend(number_vgroup.submobjects)
+            if gutter_changed:
                 # ensure all old line numbers are right aligned
-                for i in range(n_old_line_numbers):
-                    self.line_numbers[i].align_to(tmp.line_numbers[i], direction=RIGHT)
+                for row in range(min(n_old_line_numbers, n_new_lines)):
+                    number_vgroup = self.line_numbers[row]
+                    for glyph, shift in zip(number_vgroup, self._line_number_shifts(number_vgroup, row, n_new_lines)):
+                        plan.add_move(glyph, shift)
+            # only line numbers in view are rendered
+            new_line_numbers = [VGroup() for row in range(n_old_line_numbers, n_new_lines)]
+            start_row = max(n_old_line_numbers, self._scroll_row)
+            stop_row = n_new_lines if self._viewport_rows is None else min(n_new_lines, self._scroll_row + self._viewport_rows)
+            if start_row < stop_row:
+                for row, number_vgroup in enumerate(self._render_line_numbers(start_row, stop_row, n_new_lines), start=start_row):
+                    new_line_numbers[row - n_old_line_numbers] = number_vgroup
+            plan.new_line_numbers = VGroup(*new_line_numbers)
         
-        # update code_string
-        self.code_string = tmp.code_string
+        plan.hidden = VGroup(*hidden)
+        plan.shown = VGroup(*shown)
+        plan.hidden_opacities = [glyph.get_fill_opacity() for glyph in plan.hidden]
+        return plan
+    
+    @instrumentation.timed('rearrange')
+    def _rearrange(self, plan: 'EditPlan', t: float = 1):
+        # Move kept glyphs and line numbers a fraction t of the way to their planned cells,
+        # fade out removed ones and resize the background to match.
+        if t == plan.progress:
+            return
+        if plan.moved is None:
+            plan.bind_arrays()
+        dt = t - plan.progress
+        if instrumentation.enabled:
+            instrumentation.count('points_touched', plan.get_num_points())
+        # a few numpy ops however many glyphs are moved, faded or recolored (see GlyphArrays)
+        plan.moved.shift(dt * plan.move_shifts)
+        plan.faded.set_opacities(plan.fade_from + t * plan.fade_by)
+        if t == 1:
+            for glyph, old_color, new_color in plan.recolored:
+                glyph.set_color(new_color)
+        elif plan.recolored:
+            plan.recolors.set_colors(plan.recolor_from + t * plan.recolor_by)
+        for mobject, points, offsets in plan.background:
+            mobject.points = points + t * offsets
+        plan.progress = t
+    
+    @instrumentation.timed('commit_edits')
+    def commit_edits(self, plan: 'EditPlan') -> VGroup:
+        # Swap in the planned lines and line numbers once everything has been rearranged.
+        if instrumentation.enabled:
+            instrumentation.count('glyphs_moved', sum(len(mobject.family_members_with_points()) for mobject, shift in plan.moves))
+            instrumentation.count('glyphs_removed', len(plan.hidden))
+        if plan.lines is not None:
+            new_line_vgroups = []
+            for line_plan in plan.line_plans:
+                if isinstance(line_plan, slice):
+                    # untouched lines
+                    new_line_vgroups.extend(self.code.submobjects[line_plan])
+                    continue
+                line_vgroup, glyphs = line_plan
+                if glyphs is not None:
+                    if line_vgroup is None:
+                        line_vgroup = VGroup()
+                    line_vgroup.submobjects = list(glyphs)
+                new_line_vgroups.append(line_vgroup)
+            self.code.submobjects = new_line_vgroups
+            
+            if self.insert_line_no:
+                n_new_lines = len(plan.lines)
+                del self.line_numbers.submobjects[n_new_lines:]
+                self.line_numbers.submobjects.extend(plan.new_line_numbers.submobjects)
+            
+            # update the document
+            self.document.set_lines(plan.lines, plan.glyph_counts, plan.line_colors, plan.safe_lines, plan.changed_rows)
         
-        return inserted_glyphs
+        # lines (and line numbers) moving into or out of view
+        for line_vgroup in plan.dematerialized:
+            line_vgroup.submobjects = []
+        for line_vgroup, glyphs in plan.materialized:
+            line_vgroup.submobjects.extend(glyphs)
+        self._scroll_row = plan.scroll_row
+        
+        return plan.inserted_glyphs
     
-    def remove_code(self, start: int | tuple[int, int] = (0, 0), stop: int | tuple[int, int] = None, **kwargs):
-        if start == (0, 0) and stop is None:
+    def clear_code(self):
+        self.code.remove(*self.code.submobjects)
+        self.code_string = ''
+        if self.insert_line_no:
+            self.line_numbers.remove(*self.line_numbers.submobjects)
+    
+    @instrumentation.timed('set_code')
+    def set_code(self, code: str, diff: bool = True, **kwargs):
+        # diff = True -> only edit the parts of the code that differ, otherwise replace all of the code
+        code = code.strip('\n')
+        if not diff or len(self.code) == 0:
             self.clear_code()
-            return
+            return self.insert_code(0, code, **kwargs)
+        with instrumentation.timer('diff'):
+            edits = CodeDocument.diff_edits(self.code_string, code)
+        return self.edit_code(edits, **kwargs)
+    
+    def enable_viewport(self, n_lines: int | None = None):
+        # Only render the n_lines lines in view, starting at the first visible line (see scroll_to).
+        # n_lines = None -> as many lines as fit in the background.
+        # Lines out of view are kept as text and rendered from the glyph cache when they scroll into view,
+        # so the cost of each frame depends on the size of the viewport rather than the length of the code.
+        if n_lines is None:
+            metrics = self._layout_metrics()
+            # inverse of the height in _autosize_background
+            code_height = self.background_mobject.height + self._code_origin_offset[1] - metrics['descent'] - self.margin
+            n_lines = int(code_height / metrics['line_pitch'] + 1e-6) + 1
+        self._viewport_rows = max(n_lines, 1)
         
-        # if player is supplied, then play the removal animations
+        n_rows = len(self.get_lines())
+        stop_row = min(self._scroll_row + self._viewport_rows, n_rows)
+        for row in [*range(self._scroll_row), *range(stop_row, n_rows)]:
+            self.code[row].remove(*self.code[row].submobjects)
+            if self.insert_line_no:
+                self.line_numbers[row].remove(*self.line_numbers[row].submobjects)
+        self._materialize(range(self._scroll_row, stop_row))
+        self._materialize_line_numbers(self._scroll_row, stop_row)
+    
+    def disable_viewport(self):
+        # render all lines again
+        if self._viewport_rows is None:
+            return
+        self.scroll_to(0)
+        self._viewport_rows = None
+        n_rows = len(self.get_lines())
+        self._materialize(range(n_rows))
+        self._materialize_line_numbers(0, n_rows)
+    
+    @instrumentation.timed('scroll_to')
+    def scroll_to(self, line_index: int, **kwargs):
+        # Scroll the viewport so that line_index is the first visible line, enables the viewport if needed.
+        # if player is supplied, then play the scroll animation
         # otherwise just update the code instantly
         player: Scene = kwargs.pop('player', None)
         if player is not None:
-            run_time = kwargs.pop('run_time', 1)
-            player.play(self.animate(run_time=run_time).remove_code(start, stop, rearrange_only=True, **kwargs))
-            self.remove_code(start, stop, **kwargs)
+            self._play_animations(player, ScrollCode(self, line_index, **kwargs))
+            return
+        plan = self.plan_scroll(line_index)
+        self._rearrange(plan)
+        self.commit_edits(plan)
+    
+    def scroll_by(self, n_lines: int, **kwargs):
+        self.scroll_to(self._scroll_row + n_lines, **kwargs)
+    
+    def scroll_to_last_line(self, **kwargs):
+        # remove all but the last line which moves up to the first line
+        if len(self.code) < 2:
             return
+        self.remove_code((0, 0), (len(self.code) - 1, 0), **kwargs)
+    
+    @instrumentation.timed('plan_scroll')
+    def plan_scroll(self, line_index: int) -> 'EditPlan':
+        # Plan scrolling the viewport so that line_index is the first visible line (see scroll_to).
+        # Lines scrolling out of view fade out and drop their glyphs, lines scrolling into view are rendered
+        # and fade in. Scrolls by less than the viewport slide the lines, longer jumps cross fade.
+        if self._viewport_rows is None:
+            self.enable_viewport()
+        lines = self.get_lines()
+        n_rows = len(lines)
+        plan = EditPlan()
+        plan.lines = None  # the code is unchanged
+        plan.scroll_row = min(max(line_index, 0), max(n_rows - 1, 0))
+        delta = plan.scroll_row - self._scroll_row
+        if delta == 0:
+            return plan
         
-        lines = self.code_string.strip('\n').split('\n')
-        n_lines = len(lines)
-
-        start_line_index, start_char_index = self._get_char_pos(start, lines)
-        if stop is None:
-            stop_line_index, stop_char_index = len(lines), 0
-        else:
-            stop_line_index, stop_char_index = self._get_char_pos(stop, lines)
+        old_rows = range(self._scroll_row, min(self._scroll_row + self._viewport_rows, n_rows))
+        new_rows = range(plan.scroll_row, min(plan.scroll_row + self._viewport_rows, n_rows))
+        line_vgroups = [self.code] + ([self.line_numbers] if self.insert_line_no else [])
+        hidden = []
+        for row in old_rows:
+            if row not in new_rows:
+                for vgroup in line_vgroups:
+                    hidden.extend(vgroup[row].submobjects)
+                    plan.dematerialized.append(vgroup[row])
+        plan.hidden = VGroup(*hidden)
         
-        # ignore whitespace to match glyph indices
-        start_glyph_index = len(re.sub(r'\s+', '', lines[start_line_index][:start_char_index]))
-        if stop_line_index < n_lines:
-            stop_glyph_index = len(re.sub(r'\s+', '', lines[stop_line_index][:stop_char_index]))
-        else:
-            stop_glyph_index = 0
+        # lines scrolling into view are rendered where they are before the scroll
+        entering_rows = [row for row in new_rows if row not in old_rows]
+        if entering_rows:
+            materialized_rows = [row for row in entering_rows if not self._is_materialized(row)]
+            colors = self.document.get_line_colors()
+            rendered = self._render_rows(materialized_rows, [lines[row] for row in materialized_rows], [colors[row] for row in materialized_rows], n_rows)
+            plan.materialized.extend(zip([self.code[row] for row in materialized_rows], rendered))
+            if self.insert_line_no:
+                numbers = self._render_line_numbers(entering_rows[0], entering_rows[-1] + 1, n_rows)
+                plan.materialized.extend(zip([self.line_numbers[row] for row in entering_rows], numbers))
+            plan.entering = VGroup(*[glyph for line_vgroup, glyphs in plan.materialized for glyph in glyphs])
+            plan.entering.set_opacity(0)
+            plan.shown = VGroup(*plan.entering)
         
-        # updated code
-        new_lines = lines.copy()
-        if start_line_index == stop_line_index:
-            new_lines[start_line_index] = new_lines[start_line_index][:start_char_index] + new_lines[start_line_index][stop_char_index:]
+        shift = delta * self._layout_metrics()['line_pitch'] * UP
+        if abs(delta) < self._viewport_rows:
+            rows = sorted({*old_rows, *new_rows})
+            plan.add_move(VGroup(*[vgroup[row] for vgroup in line_vgroups for row in rows], plan.entering), shift)
         else:
-            new_lines[start_line_index] = new_lines[start_line_index][:start_char_index]
-            if stop_line_index < n_lines:
-                new_lines[start_line_index] += new_lines[stop_line_index][stop_char_index:]
-            del new_lines[start_line_index+1:stop_line_index+1]
-        
-        new_code = '\n'.join(new_lines)
-
-        tmp = DynamicCode(code=new_code, clone_attrs_from=self)
-        tmp.align_to(self, direction=UL)
-
-        # if tmp.code.get_edge_center(UP)[1] < self.code.get_edge_center(UP)[1]:
-        #     # in case self.code is scrolled up above background
-        #     tmp.code.align_to(self.code, direction=UP)
-        #     if self.insert_line_no:
-        #         tmp.line_numbers.align_to(self.line_numbers, direction=UP)
-
-        # hide glyphs to be removed
-        glyphs_to_be_removed = VGroup()
-        lines_to_be_removed = VGroup()
-        if start_line_index == stop_line_index:
-            glyphs_to_be_removed = self.code[start_line_index][start_glyph_index:stop_glyph_index]
-        else:
-            for i in range(start_line_index, stop_line_index + 1):
-                if i == start_line_index:
-                    glyphs_to_be_removed = self.code[i][start_glyph_index:]
-                elif i < n_lines:
-                    if i == stop_line_index:
-                        glyphs_to_be_removed.add(self.code[i][:stop_glyph_index])
-                    else:
-                        glyphs_to_be_removed.add(self.code[i][:])
-                    lines_to_be_removed.add(self.code[i])
-        glyphs_to_be_removed.set_opacity(0)
+            # lines out of view fade out in place and lines in view fade in in place
+            VGroup(*[vgroup[row] for vgroup in line_vgroups for row in new_rows], plan.entering).shift(shift)
+        plan.hidden_opacities = [glyph.get_fill_opacity() for glyph in plan.hidden]
+        return plan
+    
+    def _init_layout(self):
+        # Locate the monospace grid that Code laid the glyphs out on so that later edits can place glyphs
+        # by (row, column) rather than re-rendering the whole listing.
+        # Offsets are relative to the grid anchor, an invisible point at the background's top left corner which moves
+        # with the DynamicCode but, unlike the background's bounding box, does not change as the background is resized.
+        top_left = self.background_mobject.get_corner(UL)
+        self._add_grid_anchor()
+        lines = self.document.lines
+        gutter_width = self._gutter_width(len(lines))
+        default_origin = top_left + self.margin * RIGHT + (self.margin + self._layout_metrics()['ascent']) * DOWN
 
         if self.insert_line_no:
-            # in case max number of digits in all line numbers changes
-            self.code.align_to(tmp.code, direction=LEFT)
-            self.line_numbers[:len(tmp.line_numbers)].align_to(tmp.line_numbers, direction=UR)
-            # hide line numbers to be removed
-            self.line_numbers[len(tmp.line_numbers):].set_opacity(0)
-
-        # shift lines and glyphs
-        if stop_line_index < n_lines:
-            if stop_line_index != start_line_index:
-                self.code[stop_line_index:].align_to(tmp.code, direction=DOWN)
-            if stop_glyph_index < len(self.code[stop_line_index]):
-                self.code[stop_line_index][stop_glyph_index:].align_to(tmp.code[start_line_index][start_glyph_index:], direction=LEFT)
-        
-        if self.insert_line_no:
-            # in case max number of digits in all line numbers changes
-            self.code.align_to(tmp.code, direction=LEFT)
-        
-        # shrink background?
-        autosize: bool = kwargs.pop('autosize', False)
-        autowidth: bool = kwargs.pop('autowidth', False)
-        autoheight: bool = kwargs.pop('autoheight', False)
-        if autosize:
-            self.set_background_size(tmp.background_mobject.width, tmp.background_mobject.height)
-        elif autowidth:
-            self.set_background_width(tmp.background_mobject.width)
-        elif autoheight:
-            self.set_background_height(tmp.background_mobject.height)
+            numbers = [self._line_number_string(row, len(lines)) for row in range(len(self.line_numbers))]
+            gutter_origin = self._find_grid_origin(self.line_numbers, numbers)
+            if gutter_origin is None:
+                gutter_origin = default_origin
+            self._gutter_origin_offset = gutter_origin - top_left
+            # Code right aligns the line numbers on their rendered width, see _line_number_alignment
+            number_glyphs = self.line_numbers.family_members_with_points()
+            if number_glyphs:
+                gutter_right = max(glyph.points[:, 0].max() for glyph in number_glyphs)
+            else:
+                gutter_right = gutter_origin[0] + gutter_width
+            self._gutter_right_offset = gutter_right - top_left[0] - gutter_width
+            default_origin = gutter_origin + (gutter_width + self.line_no_buff) * RIGHT
         
-        if kwargs.pop('rearrange_only', False):
-            return
-
-        # remove deleted lines/glyphs
-        if start_line_index == stop_line_index:
-            self.code[start_line_index].remove(*self.code[start_line_index][start_glyph_index:stop_glyph_index])
-        else:
-            self.code[start_line_index].remove(*self.code[start_line_index][start_glyph_index:])
-            if stop_line_index < n_lines:
-                self.code[start_line_index].add(*self.code[stop_line_index][stop_glyph_index:])
-            self.code.remove(*lines_to_be_removed)
-
-        if self.insert_line_no:
-            self.line_numbers.remove(*self.line_numbers[len(tmp.line_numbers):])
+        code_origin = self._find_grid_origin(self.code, [self._visual_line(line) for line in lines])
+        if code_origin is None:
+            # no glyphs to measure
+            code_origin = default_origin
         
-        # update code_string
-        self.code_string = tmp.code_string
+        # code origin without the line number gutter which grows with the number of lines
+        self._code_origin_offset = code_origin - top_left - gutter_width * RIGHT
     
-    def clear_code(self):
-        self.code.remove(*self.code.submobjects)
-        self.code_string = ''
-        if self.insert_line_no:
-            self.line_numbers.remove(*self.line_numbers.submobjects)
+    def _add_grid_anchor(self):
+        self._grid_anchor = VectorizedPoint(self.background_mobject.get_corner(UL))
+        self.add(self._grid_anchor)
     
-    def set_code(self, code: str, **kwargs):
-        self.clear_code()
-        self.insert_code(0, code.strip('\n'), **kwargs)
-
-    def scroll_to_last_line(self, **kwargs):
-        if len(self.code) < 2:
+    def _share_outlines(self):
+        # identical glyphs share one outline (see SharedGlyph), so a long listing only keeps
+        # an outline per distinct (char, color) plus an offset per glyph
+        for line in [*self.line_numbers, *self.code]:
+            for glyph in line:
+                SharedGlyph.share(glyph)
+    
+    def _layout_metrics(self) -> dict:
+        key = (self.font, self.font_size, self.line_spacing)
+        metrics = _layout_metrics_cache.get(key, None)
+        if metrics is None:
+            # The first point of the 'M' glyph defines the origin of its cell.
+            # Two cells on the first line give the char width, the second line gives the line pitch,
+            # and a full height bar on the third line gives the vertical extent of a line.
+            # Text has (invisible) placeholder dots for the newlines which are dropped.
+            m0, m1, m2, bar = remove_invisible_chars(self._render_text('MM\nM\n|'))
+            origin = m0.points[0]
+            line_pitch = origin[1] - m2.points[0][1]
+            baseline = origin[1] - 2 * line_pitch
+            metrics = {
+                'char_width': m1.points[0][0] - origin[0],
+                'line_pitch': line_pitch,
+                'ascent': bar.get_top()[1] - baseline,
+                'descent': baseline - bar.get_bottom()[1],
+                # char -> offset of the glyph's first point from its cell origin
+                'glyph_offsets': {'M': np.zeros(3)},
+            }
+            _layout_metrics_cache[key] = metrics
+        return metrics
+    
+    @instrumentation.timed('render_text')
+    def _render_text(self, text: str) -> Text:
+        instrumentation.count('text_renders')
+        return Text(text, font=self.font, font_size=self.font_size, line_spacing=self.line_spacing, disable_ligatures=True)
+    
+    @instrumentation.timed('render_lines')
+    def _render_lines(self, visual_lines: list[str], colors: list[list[str]]) -> VGroup:
+        # Stamp copies of cached glyphs into one VGroup of glyphs per visual line (see _visual_line)
+        # with the cell origin of the first line at ORIGIN. Only glyphs missing from the cache are rendered.
+        layouts = [list(zip(self._glyph_columns(visual_line), line_colors)) for visual_line, line_colors in zip(visual_lines, colors)]
+        keys = {self._glyph_key(char, color) for layout in layouts for (char, col), color in layout}
+        templates = {key: glyph_cache.get(key) for key in keys}
+        templates.update(self._render_glyph_templates([key for key, template in templates.items() if template is None]))
+        line_vgroups = VGroup()
+        for row, layout in enumerate(layouts):
+            line_vgroup = VGroup()
+            for (char, col), color in layout:
+                key = self._glyph_key(char, color)
+                line_vgroup.add(templates[key].copy().shift(self._cell(row, col)))
+            line_vgroups.add(line_vgroup)
+            instrumentation.count('glyphs_created', len(line_vgroup))
+        return line_vgroups
+    
+    def _glyph_key(self, char: str, color: str) -> tuple:
+        return (char, color, self.font, self.font_size, self.style)
+    
+    def _render_glyph_templates(self, keys: list[tuple], char_glyphs: dict[str, VMobject] | None = None) -> dict[tuple, VMobject]:
+        # Cache a glyph for each key with its points relative to its cell origin.
+        # char_glyphs are glyphs already rendered elsewhere (see EditScript), other chars are rendered now.
+        if not keys:
+            return {}
+        char_glyphs = dict(char_glyphs or {})
+        missing_chars = sorted({key[0] for key in keys} - char_glyphs.keys())
+        if missing_chars:
+            char_glyphs.update(self._render_char_glyphs(missing_chars))
+        offsets = self._layout_metrics()['glyph_offsets']
+        templates = {}
+        for key in keys:
+            glyph = char_glyphs[key[0]]
+            offsets[key[0]] = glyph.points[0].copy()
+            template = SharedGlyph.share(glyph.copy().set_color(key[1]))
+            glyph_cache.put(key, template)
+            templates[key] = template
+        return templates
+    
+    def _render_char_glyphs(self, chars: list[str]) -> dict[str, VMobject]:
+        # Render each char once in consecutive cells after an anchoring 'M', with points relative to its cell origin.
+        glyphs = self._render_text('M' + ''.join(chars)).submobjects
+        origin = glyphs[0].points[0]
+        return {
+            char: glyph.shift(-origin - self._cell(0, col))
+            for col, (char, glyph) in enumerate(zip(chars, glyphs[1:]), start=1)
+        }
+    
+    def _render_rows(self, rows: list[int], lines: list[str], colors: list[list[str]], n_rows: int) -> VGroup:
+        # glyphs of lines in their cells at rows of a listing with n_rows lines
+        line_vgroups = self._render_lines([self._visual_line(line) for line in lines], colors)
+        origin = self._code_origin(n_rows)
+        for i, (row, line_vgroup) in enumerate(zip(rows, line_vgroups)):
+            line_vgroup.shift(origin + self._cell(row, 0) - self._cell(i, 0))
+        return line_vgroups
+    
+    def _render_line_numbers(self, start_row: int, stop_row: int, n_rows: int = None) -> VGroup:
+        # line numbers for rows start_row up to stop_row - 1 of a listing with n_rows (default stop_row) lines
+        if n_rows is None:
+            n_rows = stop_row
+        numbers = [self._line_number_string(row, n_rows) for row in range(start_row, stop_row)]
+        colors = [[self._default_color] * len(number.strip()) for number in numbers]
+        line_numbers = self._render_lines(numbers, colors)
+        line_numbers.shift(self._gutter_origin() + self._cell(start_row, 0))
+        for number_vgroup in line_numbers:
+            number_vgroup.shift(self._line_number_alignment(number_vgroup, n_rows))
+        return line_numbers
+    
+    def _in_viewport(self, row: int) -> bool:
+        return self._viewport_rows is None or self._scroll_row <= row < self._scroll_row + self._viewport_rows
+    
+    def _rows_in_viewport(self, start_row: int, stop_row: int, shift: int = 0) -> range:
+        # rows from start_row up to stop_row that are in view once moved by shift rows
+        if self._viewport_rows is None:
+            return range(start_row, stop_row)
+        return range(max(start_row, self._scroll_row - shift), min(stop_row, self._scroll_row + self._viewport_rows - shift))
+    
+    def _is_materialized(self, line_index: int) -> bool:
+        # whether the line has its glyphs, lines out of the viewport are kept as text only
+        return len(self.code[line_index]) > 0 or self.document.glyph_index(line_index, len(self.document.lines[line_index])) == 0
+    
+    def _materialize(self, line_indices, opacity: float = 1) -> list[int]:
+        # render the glyphs of lines that are out of the viewport in their cells, returns the rendered line indices
+        line_indices = sorted(line_index for line_index in line_indices if not self._is_materialized(line_index))
+        if not line_indices:
+            return []
+        colors = self.document.get_line_colors()
+        line_vgroups = self._render_rows(
+            line_indices, [self.document.lines[line_index] for line_index in line_indices],
+            [colors[line_index] for line_index in line_indices], len(self.document.lines),
+        )
+        for line_index, line_vgroup in zip(line_indices, line_vgroups):
+            line_vgroup.set_opacity(opacity)
+            self.code[line_index].add(*line_vgroup)
+        return line_indices
+    
+    def _materialize_line_numbers(self, start_row: int, stop_row: int):
+        if not self.insert_line_no:
             return
-        
-        # if player is supplied, then play the scroll animation
-        # otherwise just update the code instantly
-        player: Scene = kwargs.pop('player', None)
-        if player is not None:
-            run_time = kwargs.pop('run_time', 1)
-            lag_ratio = 1.0 / (len(self.code) - 1)
-            dy = self.code[0].get_edge_center(UP)[1] - self.code[-1].get_edge_center(UP)[1]
-            pre_animation_mobjects = player.mobjects.copy()
-            player.play(
-                self.code[-1].animate(run_time=run_time).shift(dy * UP),
-                FadeOut(self.code[:-1], run_time=run_time)#, lag_ratio=lag_ratio)
-                # self.code[:-1].animate(run_time=run_time, lag_ratio=lag_ratio).set_opacity(0)
-            )
-            player.mobjects = pre_animation_mobjects
-        else:
-            self.code[-1].align_to(self.code[0], direction=UP)
-        
-        self.code.remove(*self.code[:-1])
-        lines = self.code_string.strip('\n').split('\n')
-        self.code_string = lines[-1]
+        rows = [row for row in range(start_row, stop_row) if len(self.line_numbers[row]) == 0]
+        if not rows:
+            return
+        number_vgroups = self._render_line_numbers(rows[0], rows[-1] + 1, len(self.line_numbers))
+        for row in rows:
+            self.line_numbers[row].add(*number_vgroups[row - rows[0]])
+    
+    def _line_number_string(self, row: int, n_rows: int) -> str:
+        # right aligned on the grid, see _line_number_alignment for the final alignment
+        n_digits = len(str(self.line_no_from + max(n_rows, 1) - 1))
+        return str(self.line_no_from + row).rjust(n_digits)
+    
+    def _visual_line(self, line: str) -> str:
+        # Mimic how Code lays out a line: leading indentation_chars become tabs and tabs become tab_width spaces.
+        stripped = line.lstrip()
+        indent = line[:len(line) - len(stripped)]
+        if self.indentation_chars and line.startswith(self.indentation_chars):
+            n_indents = indent.count(self.indentation_chars)
+            indent = '\t' * n_indents + indent[indent.rfind(self.indentation_chars) + len(self.indentation_chars):]
+        return (indent + stripped).replace('\t', ' ' * self.tab_width)
     
     @staticmethod
-    def _get_char_pos(pos: int | tuple[int, int], lines: list[str] | VGroup) -> tuple[int, int]:
-        if len(lines) == 0:
-            return 0, 0
-        
-        # pos -> line and char indices
-        if isinstance(pos, int):
-            # first char of line at pos
-            line_index, char_index = pos, 0
-        else:
-            line_index, char_index = pos
-        
-        # None -> end of line
-        if char_index is None:
-            char_index = len(lines[line_index])
-        
-        # negative -> positive indices
-        if line_index < 0:
-            line_index = len(lines) + line_index
-        if char_index < 0:
-            char_index = len(lines[line_index]) + char_index
-        
-        return line_index, char_index
+    def _glyph_columns(visual_line: str) -> list[tuple[str, int]]:
+        # (char, column) for each glyph, there are no glyphs for whitespace
+        return [(char, col) for col, char in enumerate(visual_line) if not char.isspace()]
+    
+    def _cell(self, row: int, col: int) -> np.ndarray:
+        metrics = self._layout_metrics()
+        return np.array([col * metrics['char_width'], -row * metrics['line_pitch'], 0])
+    
+    def _glyph_offset(self, char: str) -> np.ndarray:
+        offsets = self._layout_metrics()['glyph_offsets']
+        if char not in offsets:
+            self._render_glyph_templates([self._glyph_key(char, self._default_color)])
+        return offsets[char]
+    
+    def _find_grid_origin(self, line_vgroups: VGroup, visual_lines: list[str]) -> np.ndarray | None:
+        for row, (line_vgroup, visual_line) in enumerate(zip(line_vgroups, visual_lines)):
+            if len(line_vgroup):
+                char, col = self._glyph_columns(visual_line)[0]
+                return line_vgroup[0].points[0] - self._glyph_offset(char) - self._cell(row, col)
+        return None
+    
+    def _gutter_width(self, n_rows: int) -> float:
+        if not self.insert_line_no:
+            return 0
+        return len(self._line_number_string(0, n_rows)) * self._layout_metrics()['char_width']
+    
+    def _gutter_origin(self) -> np.ndarray:
+        return self._grid_anchor.get_location() + self._gutter_origin_offset + self._scroll_offset()
+    
+    def _code_origin(self, n_rows: int) -> np.ndarray:
+        # cell origin of the first line for a listing with n_rows lines
+        return self._grid_anchor.get_location() + self._code_origin_offset + self._gutter_width(n_rows) * RIGHT + self._scroll_offset()
+    
+    def _scroll_offset(self) -> np.ndarray:
+        # lines above the first visible line are above the background
+        return self._scroll_row * self._layout_metrics()['line_pitch'] * UP
+    
+    def _glyph_shifts(self, glyphs: VGroup, line: str, row: int, first_glyph_index: int, n_rows: int) -> list[np.ndarray]:
+        # shifts that move glyphs, which are the line's glyphs starting at first_glyph_index, to their cells in row
+        origin = self._code_origin(n_rows) + self._cell(row, 0)
+        columns = self._glyph_columns(self._visual_line(line))[first_glyph_index:]
+        return [
+            origin + self._cell(0, col) + self._glyph_offset(char) - glyph.points[0]
+            for glyph, (char, col) in zip(glyphs, columns)
+        ]
+    
+    def _lines_shift(self, line_vgroups: VGroup, lines: list[str], first_row: int, n_rows: int) -> np.ndarray:
+        # Lines move rigidly, so a single glyph gives the shift for all of them.
+        for i, (line_vgroup, line) in enumerate(zip(line_vgroups, lines)):
+            if len(line_vgroup):
+                char, col = self._glyph_columns(self._visual_line(line))[0]
+                target = self._code_origin(n_rows) + self._cell(first_row + i, col) + self._glyph_offset(char)
+                return target - line_vgroup[0].points[0]
+        return np.zeros(3)
+    
+    def _line_number_shifts(self, number_vgroup: VGroup, row: int, n_rows: int) -> list[np.ndarray]:
+        origin = self._gutter_origin() + self._cell(row, 0)
+        shifts = [
+            origin + self._cell(0, col) + self._glyph_offset(char) - glyph.points[0]
+            for glyph, (char, col) in zip(number_vgroup, self._glyph_columns(self._line_number_string(row, n_rows)))
+        ]
+        alignment = self._line_number_alignment(number_vgroup, n_rows, shifts)
+        return [shift + alignment for shift in shifts]
+    
+    def _line_number_alignment(self, number_vgroup: VGroup, n_rows: int, shifts: list[np.ndarray] | None = None) -> np.ndarray:
+        # Horizontal shift that right aligns a line number (once moved by shifts) on its rendered width, as Code does
+        # (Paragraph with alignment="right"). Digits differ in their side bearings, so this is not quite the same as
+        # right aligning on the monospace grid.
+        if len(number_vgroup) == 0:
+            return np.zeros(3)
+        if shifts is None:
+            shifts = [np.zeros(3)] * len(number_vgroup)
+        right = max(glyph.points[:, 0].max() + shift[0] for glyph, shift in zip(number_vgroup, shifts))
+        gutter_right = self._grid_anchor.get_location()[0] + self._gutter_right_offset + self._gutter_width(n_rows)
+        return (gutter_right - right) * RIGHT
+    
+    def _autosize_background(self, lines: list[str], autosize: bool = False, autowidth: bool = False, autoheight: bool = False) -> tuple | None:
+        # (width, height) of the background that fits lines as laid out on the grid, None -> no resize
+        if not (autosize or autowidth or autoheight):
+            return None
+        metrics = self._layout_metrics()
+        top_left = self._grid_anchor.get_location()
+        origin = self._code_origin(len(lines)) - self._scroll_offset()
+        n_cols = max((len(self._visual_line(line).rstrip()) for line in lines), default=0)
+        width = origin[0] - top_left[0] + n_cols * metrics['char_width'] + self.margin
+        height = top_left[1] - origin[1] + (len(lines) - 1) * metrics['line_pitch'] + metrics['descent'] + self.margin
+        if autosize:
+            return width, height
+        elif autowidth:
+            return width, None
+        return None, height
     
     # @staticmethod
     # def strip_multiline_initial_indent(code: str) -> str:
@@ -485,6 +1674,462 @@ class DynamicCode(VGroup):
     #     return code
 
 
+class ResizeBackground(Animation):
+    # Animate resizing a DynamicCode's background (see DynamicCode.set_background_size).
+    # Only the width and height are interpolated, so each frame is a single offset of the starting points
+    # rather than an interpolation of every point of the background.
+
+    def __init__(self, dcode: DynamicCode, width: float | str = None, height: float | str = None, **kwargs):
+        self.dcode = dcode
+        self.width = width
+        self.height = height
+        super().__init__(dcode.background_mobject, **kwargs)
+    
+    def begin(self):
+        self.resize_offsets = [
+            (mobject, mobject.points.copy(), offsets)
+            for mobject, offsets in self.dcode._background_resize_offsets(self.width, self.height)
+        ]
+        super().begin()
+    
+    def interpolate_mobject(self, alpha: float):
+        t = self.rate_func(alpha)
+        for mobject, points, offsets in self.resize_offsets:
+            mobject.points = points + t * offsets
+
+
+class EditPlan:
+    # Layout of a batch of edits computed once by DynamicCode.plan_edits.
+    # The rearrangement (see RearrangeCode) moves and hides existing glyphs, then the commit swaps in the new lines.
+
+    def __init__(self):
+        self.lines = []  # lines of code after the edits
+        self.changed_rows = None  # (start_row, old_stop_row, new_stop_row) of the lines replaced by the edits, see CodeDocument.set_lines
+        self.glyph_counts = []  # per line prefix counts of glyphs after the edits (None -> not computed yet)
+        self.line_plans = []  # (existing line vgroup or None, glyphs or None -> unchanged) for each new line, or a slice of untouched old lines
+        self.moves = []  # (mobject, shift) moving existing glyphs, lines and line numbers to their new cells
+        self.hidden = VGroup()  # existing glyphs and line numbers that are removed
+        self.hidden_opacities = []
+        self.background = []  # (mobject, start points, offsets) resizing the background
+        self.inserted_glyphs = VGroup()  # new glyphs already in their cells, animations play on these so nothing needs rebinding
+        self.inserted_glyph_locations = []  # (line_index, glyph_index) of each inserted glyph
+        self.new_line_numbers = VGroup()
+        self.line_colors = []  # per line syntax highlighting colors of glyphs after the edits
+        self.safe_lines = []  # see DynamicCode._relex
+        self.recolored = []  # (glyph, old color, new color) existing glyphs whose highlighting changed
+        # viewport (see DynamicCode.enable_viewport)
+        self.scroll_row = None  # first visible line
+        self.shown = VGroup()  # glyphs faded in during the rearrangement
+        self.entering = VGroup()  # glyphs of lines moving into view, see materialized
+        self.materialized = []  # (line or line number vgroup, glyphs) rendered as they move into view
+        self.dematerialized = []  # line or line number vgroups that drop their glyphs as they move out of view
+        self.progress = 0  # fraction of the rearrangement applied so far
+        # shared arrays of the moved, faded (hidden then shown) and recolored glyphs, see bind_arrays
+        self.moved = None
+        self.faded = None
+        self.recolors = None
+    
+    def add_move(self, mobject: Mobject, shift: np.ndarray):
+        if np.any(shift):
+            self.moves.append((mobject, shift))
+    
+    def bind_arrays(self):
+        # Gather the glyphs of the rearrangement into GlyphArrays once the plan is complete,
+        # along with the per glyph shifts, opacities and colors that each step interpolates.
+        moves = {}  # id -> [glyph, total shift], a glyph may be in several moves
+        for mobject, shift in self.moves:
+            for glyph in mobject.family_members_with_points():
+                moves.setdefault(id(glyph), [glyph, 0])[1] += shift
+        self.moved = GlyphArrays([glyph for glyph, shift in moves.values()], rgbas=False, offsets=True)
+        self.move_shifts = np.array([shift for glyph, shift in moves.values()], dtype=float).reshape(-1, 3)
+
+        recolored = [glyph for glyph, old_color, new_color in self.recolored]
+        arrays = GlyphArrays([*self.hidden, *self.shown, *recolored])
+        n_faded = len(self.hidden) + len(self.shown)
+        self.faded = arrays.part(0, n_faded)
+        self.recolors = arrays.part(n_faded, n_faded + len(recolored))
+        hidden_opacities = np.array(self.hidden_opacities, dtype=float)
+        self.fade_from = np.concatenate([hidden_opacities, np.zeros(len(self.shown))])
+        self.fade_by = np.concatenate([-hidden_opacities, np.ones(len(self.shown))])
+        if recolored:
+            self.recolor_from = np.array([color_to_rgb(old_color) for glyph, old_color, new_color in self.recolored])
+            self.recolor_by = np.array([color_to_rgb(new_color) for glyph, old_color, new_color in self.recolored]) - self.recolor_from
+    
+    def get_num_points(self) -> int:
+        # points changed by each step of the rearrangement (see Instrumentation)
+        mobjects = [
+            *[mobject for move, shift in self.moves for mobject in move.family_members_with_points()],
+            *self.hidden, *self.shown.family_members_with_points(), *[glyph for glyph, old, new in self.recolored],
+            *[mobject for mobject, points, offsets in self.background],
+        ]
+        return sum(mobject.get_num_points() for mobject in mobjects)
+
+
+class RearrangeCode(Animation):
+    # Animate the rearrangement of an EditPlan. Each frame shifts only the moved glyphs and fades only the
+    # removed ones, rather than interpolating every point of the DynamicCode against a copy of itself.
+
+    def __init__(self, dcode: DynamicCode, plan: EditPlan, **kwargs):
+        self.dcode = dcode
+        self.plan = plan
+        super().__init__(dcode, **kwargs)
+    
+    def create_starting_mobject(self) -> Mobject:
+        # the plan holds everything needed to interpolate, so skip copying the code
+        return Mobject()
+    
+    def interpolate_mobject(self, alpha: float):
+        self.dcode._rearrange(self.plan, self.rate_func(alpha))
+
+
+class RevealGlyphs(Animation):
+    # Fade in glyphs one after another (as lag_ratio does for a group of fades), optionally sliding each of them
+    # into place from shift away. Every glyph's opacity (and offset) comes from a single lag schedule and is written
+    # with one numpy op per frame (see GlyphArrays) rather than a sub-animation and a target copy per glyph,
+    # so a frame costs about the same however many glyphs are revealed.
+    #   self.play(RevealGlyphs(dcode.glyphs_at((3, 0), (5, 0)), lag_ratio=0.05, shift=0.2 * DOWN))
+    # opacity can also be per glyph. Pass reveal_at (per glyph alpha) to show each glyph at once at that alpha
+    # instead, e.g. as it is typed (see StreamCode).
+
+    def __init__(self, glyphs: VGroup, opacity: float | list[float] = 1, shift: np.ndarray | None = None, reveal_at: list[float] | None = None, lag_ratio: float = 0.1, **kwargs):
+        self.glyphs = glyphs
+        self.opacity = opacity
+        self.shift_vector = None if shift is None else np.asarray(shift, dtype=float)
+        self.reveal_at = None if reveal_at is None else np.asarray(reveal_at, dtype=float)
+        super().__init__(glyphs, lag_ratio=lag_ratio, **kwargs)
+    
+    def create_starting_mobject(self) -> Mobject:
+        # the glyphs are revealed in place, so skip copying them
+        return Mobject()
+    
+    def begin(self):
+        n_glyphs = len(self.glyphs)
+        self.arrays = GlyphArrays(self.glyphs.submobjects, offsets=self.shift_vector is not None)
+        self.opacities = np.broadcast_to(np.asarray(self.opacity, dtype=float), (n_glyphs,))
+        self.lags = np.arange(n_glyphs) * self.lag_ratio
+        self.full_length = max(n_glyphs - 1, 0) * self.lag_ratio + 1
+        # rate functions take a single alpha, so sample it once and interpolate all glyphs' sub alphas at once
+        self.rate_alphas = np.linspace(0, 1, 1025)
+        self.rate_values = np.array([self.rate_func(alpha) for alpha in self.rate_alphas], dtype=float)
+        self.progress = np.zeros(n_glyphs)
+        if self.shift_vector is not None:
+            self.arrays.shift(-self.shift_vector)
+        super().begin()
+    
+    def interpolate_mobject(self, alpha: float):
+        if alpha >= 1:
+            progress = np.ones(len(self.progress))
+        elif self.reveal_at is not None:
+            progress = (self.reveal_at <= alpha).astype(float)
+        else:
+            sub_alphas = np.clip(alpha * self.full_length - self.lags, 0, 1)
+            progress = np.interp(sub_alphas, self.rate_alphas, self.rate_values)
+        self.arrays.set_opacities(progress * self.opacities)
+        if self.shift_vector is not None:
+            self.arrays.shift(np.outer(progress - self.progress, self.shift_vector))
+        self.progress = progress
+
+
+class EditCode(Animation):
+    # Animate edits (see DynamicCode.edit_code) as a regular Animation that can be played along with others, e.g.
+    #   self.play(InsertCode(dcode, (3, 0), 'import os\n'), self.camera.frame.animate.shift(UP))
+    # The edits are planned in begin(), so they refer to the code as it is when the animation starts
+    # (e.g. in a Succession). Kept glyphs are rearranged first, then the new glyphs are revealed one after another.
+    # Glyphs are edited in place and the new lines are committed in finish(), so references stay valid afterwards.
+
+    def __init__(self, dcode: DynamicCode, edits: list[tuple] = None, opacity: float = 1, lag_ratio: float = 0.1, **kwargs):
+        self.dcode = dcode
+        self.edits = edits
+        self.opacity = opacity
+        # kwargs for DynamicCode.plan_edits
+        self.plan_kwargs = {key: kwargs.pop(key) for key in ('autosize', 'autowidth', 'autoheight', 'color', 'recolor') if key in kwargs}
+        self.plan = None
+        self.inserted_glyphs = None
+        super().__init__(dcode, lag_ratio=lag_ratio, **kwargs)
+    
+    def get_edits(self) -> list[tuple]:
+        return self.edits
+    
+    def get_plan(self) -> EditPlan:
+        return self.dcode.plan_edits(self.get_edits(), opacity=0, **self.plan_kwargs)
+    
+    def create_starting_mobject(self) -> Mobject:
+        # the plan holds everything needed to interpolate, so skip copying the code
+        return Mobject()
+    
+    def begin(self):
+        self.plan = self.get_plan()
+        # fraction of the animation spent rearranging, the rest reveals the new glyphs
+        inserting = len(self.plan.inserted_glyphs) > 0
+        self.split = min(0.5, self.run_time / 2) / self.run_time if inserting else 1
+        # new glyphs and line numbers join the code hidden until they are revealed
+        self.plan.new_line_numbers.set_opacity(0)
+        self.pending = VGroup(self.plan.inserted_glyphs, self.plan.new_line_numbers, self.plan.entering)
+        self.dcode.add(self.pending)
+        self.revealed_line_numbers = False
+        self.reveal = self.get_reveal()
+        self.reveal.begin()
+        super().begin()
+    
+    def get_reveal(self) -> RevealGlyphs:
+        # driven by interpolate_mobject rather than played
+        return RevealGlyphs(
+            self.plan.inserted_glyphs, opacity=self.opacity, lag_ratio=self.lag_ratio, rate_func=self.rate_func,
+            suspend_mobject_updating=False,
+        )
+    
+    def interpolate_mobject(self, alpha: float):
+        plan = self.plan
+        self.dcode._rearrange(plan, self.rate_func(min(alpha / self.split, 1)))
+        if alpha < self.split:
+            return
+        if not self.revealed_line_numbers:
+            plan.new_line_numbers.set_opacity(1)
+            self.revealed_line_numbers = True
+        reveal_alpha = (alpha - self.split) / (1 - self.split) if self.split < 1 else 1
+        self.reveal.interpolate_mobject(reveal_alpha)
+    
+    def finish(self):
+        super().finish()
+        if self.inserted_glyphs is None:
+            self.dcode.remove(self.pending)
+            self.inserted_glyphs = self.dcode.commit_edits(self.plan)
+
+
+class InsertCode(EditCode):
+    # see DynamicCode.insert_code
+    def __init__(self, dcode: DynamicCode, pos: int | tuple[int | None, int | None] | None, code: str, **kwargs):
+        super().__init__(dcode, [(pos, pos, code)], **kwargs)
+
+
+class RemoveCode(EditCode):
+    # see DynamicCode.remove_code, removing all of the code leaves a single empty line
+    def __init__(self, dcode: DynamicCode, start: int | tuple[int, int] = (0, 0), stop: int | tuple[int, int] = None, **kwargs):
+        super().__init__(dcode, [(start, stop, '')], **kwargs)
+
+
+class MorphCode(EditCode):
+    # see DynamicCode.set_code, only the parts of the code that differ are edited
+    def __init__(self, dcode: DynamicCode, code: str, **kwargs):
+        self.code = code.strip('\n')
+        super().__init__(dcode, **kwargs)
+    
+    def get_edits(self) -> list[tuple]:
+        return CodeDocument.diff_edits(self.dcode.code_string, self.code)
+
+
+class ReplaceCode(EditCode):
+    # see DynamicCode.replace, matches (between positions start and stop, if given) are found when the animation begins
+    def __init__(self, dcode: DynamicCode, pattern: str | re.Pattern, repl, count: int | None = None, flags: int = 0, **kwargs):
+        self.pattern = pattern
+        self.repl = repl
+        self.count = count
+        self.flags = flags
+        self.start = kwargs.pop('start', (0, 0))
+        self.stop = kwargs.pop('stop', None)
+        super().__init__(dcode, **kwargs)
+    
+    def get_edits(self) -> list[tuple]:
+        return self.dcode.document.replace_edits(self.pattern, self.repl, count=self.count, flags=self.flags, start=self.start, stop=self.stop)
+
+
+class ScrollCode(EditCode):
+    # see DynamicCode.scroll_to
+    def __init__(self, dcode: DynamicCode, line_index: int, **kwargs):
+        self.line_index = line_index
+        super().__init__(dcode, **kwargs)
+    
+    def get_plan(self) -> EditPlan:
+        return self.dcode.plan_scroll(self.line_index)
+
+
+class StreamCode(EditCode):
+    # Typewriter: append text to the end of the code, revealing each new glyph (and line number)
+    # at the moment its char is typed at chars_per_second (see DynamicCode.stream).
+    # Any background resize is spread over the whole animation.
+
+    def __init__(self, dcode: DynamicCode, text: str, chars_per_second: float = 30, **kwargs):
+        self.text = text
+        kwargs.setdefault('run_time', max(len(text), 1) / chars_per_second)
+        kwargs.setdefault('rate_func', linear)
+        super().__init__(dcode, [((-1, None), (-1, None), text)], **kwargs)
+    
+    def get_plan(self) -> EditPlan:
+        # fraction of the text typed once each new glyph's char (by (line_index, glyph_index)) and each new line is typed
+        lines = self.dcode.get_lines()
+        row = max(len(lines) - 1, 0)
+        glyph_index = self.dcode.document.glyph_index(row, len(lines[-1])) if lines else 0
+        n_chars = max(len(self.text), 1)
+        typed_at = {}
+        self.line_numbers_typed_at = []
+        for i, char in enumerate(self.text):
+            if char == '\n':
+                row += 1
+                glyph_index = 0
+                self.line_numbers_typed_at.append((i + 1) / n_chars)
+            elif not char.isspace():
+                typed_at[(row, glyph_index)] = (i + 1) / n_chars
+                glyph_index += 1
+        plan = super().get_plan()
+        self.glyphs_typed_at = [typed_at[location] for location in plan.inserted_glyph_locations]
+        return plan
+    
+    def get_reveal(self) -> RevealGlyphs:
+        # new glyphs and line numbers each appear as they are typed
+        plan = self.plan
+        line_numbers = plan.new_line_numbers[:len(self.line_numbers_typed_at)]
+        return RevealGlyphs(
+            VGroup(*plan.inserted_glyphs, *line_numbers),
+            opacity=[self.opacity] * len(plan.inserted_glyphs) + [1] * len(line_numbers),
+            reveal_at=self.glyphs_typed_at + self.line_numbers_typed_at[:len(line_numbers)],
+            suspend_mobject_updating=False,
+        )
+    
+    def interpolate_mobject(self, alpha: float):
+        t = self.rate_func(alpha)
+        self.dcode._rearrange(self.plan, t)
+        self.reveal.interpolate_mobject(t)
+
+
+class EditScript:
+    # A known sequence of edits for a DynamicCode (see DynamicCode.edit_script). Each step is either a list of edits
+    # as for DynamicCode.edit_code or a code string as for DynamicCode.set_code.
+    # prerender() works out every intermediate code string up front and hands them to a process pool which highlights
+    # each of them and renders the glyphs they need (each char once, as picklable point arrays). Playback only waits
+    # for the states it has reached and takes all of its glyphs from the glyph cache, so the rest of the rendering
+    # runs behind playback. Without prerender() the steps are simply played as regular edits.
+
+    def __init__(self, dcode: DynamicCode, steps: list):
+        self.dcode = dcode
+        self.steps = [step.strip('\n') if isinstance(step, str) else step for step in steps]
+        self.code_strings = None  # code before the first step and after each step
+        self._futures = None  # prerender jobs for each of code_strings
+        self._char_glyphs = {}  # prerendered glyphs by char, relative to their cell origin
+        self._n_used = 0  # prerender jobs whose results are in use
+        self._step = 0  # next step to play
+        self._used_futures = set()
+    
+    def get_code_strings(self) -> list[str]:
+        if self.code_strings is None:
+            document = self.dcode.document.copy()
+            document.line_colors = document.safe_lines = None  # text only
+            if not self.dcode.get_lines():
+                document.set_text('')
+            self.code_strings = [document.text]
+            for step in self.steps:
+                if isinstance(step, str):
+                    document.set_text(step)
+                else:
+                    document.apply_edits(step)
+                self.code_strings.append(document.text)
+        return self.code_strings
+    
+    def prerender(self, max_workers: int | None = None) -> 'EditScript':
+        # max_workers = None -> one worker per CPU
+        dcode = self.dcode
+        seen_chars = set()
+        executor = ProcessPoolExecutor(max_workers)
+        self._futures = []
+        futures = {}  # code -> job, repeated states reuse the same job
+        for i, code in enumerate(self.get_code_strings()):
+            if code in futures:
+                self._futures.append(futures[code])
+                continue
+            new_chars = {char for char in code if not char.isspace()} - seen_chars
+            if i == 0 and dcode.insert_line_no:
+                new_chars.update('0123456789')
+            seen_chars.update(new_chars)
+            futures[code] = executor.submit(
+                _prerender_state, code, ''.join(sorted(new_chars)), dcode.language, dcode.style, dcode._default_color,
+                dcode.font, dcode.font_size, dcode.line_spacing,
+            )
+            self._futures.append(futures[code])
+        executor.shutdown(wait=False)
+        return self
+    
+    def _use_prerendered(self, state: int):
+        # cache the glyphs needed to show code_strings up to state, waiting for their jobs if needed
+        if self._futures is None:
+            return
+        dcode = self.dcode
+        while self._n_used <= state:
+            future = self._futures[self._n_used]
+            if future in self._used_futures:
+                self._n_used += 1
+                continue
+            self._used_futures.add(future)
+            with instrumentation.timer('wait_prerender'):
+                keys, rendered = future.result()
+            for char, (col, points, style) in rendered.items():
+                self._char_glyphs[char] = _leaf_from_arrays(points, style).shift(-dcode._cell(0, col))
+            if self._n_used == 0 and dcode.insert_line_no:
+                keys = keys | {(digit, dcode._default_color) for digit in '0123456789'}
+            keys = {dcode._glyph_key(char, color) for char, color in keys}
+            dcode._render_glyph_templates([key for key in keys if key not in glyph_cache], self._char_glyphs)
+            self._n_used += 1
+    
+    def play_step(self, **kwargs):
+        # Play (or if no player is supplied, apply) the next step, kwargs are as for DynamicCode.edit_code.
+        step = self.steps[self._step]
+        code_strings = self.get_code_strings()
+        if code_strings[self._step + 1] == code_strings[self._step]:
+            # nothing to edit
+            self._step += 1
+            return
+        self._use_prerendered(self._step + 1)
+        if isinstance(step, str):
+            self.dcode.set_code(step, **kwargs)
+        else:
+            self.dcode.edit_code(step, **kwargs)
+        self._step += 1
+    
+    def play(self, **kwargs):
+        # play all remaining steps
+        while self._step < len(self.steps):
+            self.play_step(**kwargs)
+
+
+class CodeEdits:
+    # Edits collected for DynamicCode.edit_code, see DynamicCode.edits.
+    # Positions are as for the DynamicCode methods of the same name and refer to the code before any edits.
+
+    def __init__(self, dcode: DynamicCode, **kwargs):
+        self.dcode = dcode
+        self.kwargs = kwargs
+        self.edits = []
+        self.inserted_glyphs = None
+    
+    def __enter__(self) -> 'CodeEdits':
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.apply()
+    
+    def apply(self) -> VGroup:
+        self.inserted_glyphs = self.dcode.edit_code(self.edits, **self.kwargs)
+        self.edits = []
+        return self.inserted_glyphs
+    
+    def append_code(self, code: str, line_index: int = -1):
+        self.insert_code((line_index, None), code)
+    
+    def prepend_code(self, code: str, line_index: int = 0):
+        self.insert_code((line_index, 0), code)
+    
+    def insert_code(self, pos: int | tuple[int | None, int | None], code: str):
+        self.edits.append((pos, pos, code))
+    
+    def remove_code(self, start: int | tuple[int, int], stop: int | tuple[int, int] = None):
+        self.edits.append((start, stop, ''))
+    
+    def replace_range(self, start: int | tuple[int, int], stop: int | tuple[int, int], code: str):
+        self.edits.append((start, stop, code))
+    
+    def replace(self, pattern: str | re.Pattern, repl, count: int | None = None, flags: int = 0, start: int | tuple[int, int] = (0, 0), stop: int | tuple[int, int] | None = None):
+        self.edits.extend(self.dcode.document.replace_edits(pattern, repl, count=count, flags=flags, start=start, stop=stop))
+
+
 class DynamicCodeExampleScene(Scene):
     def construct(self):
         fresh = """
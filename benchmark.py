@@ -0,0 +1,208 @@
+# Headless benchmarks for DynamicCode edit operations across listing sizes.
+# Nothing is displayed or written to disk (scenes run with manim's dry_run), so it runs anywhere manim imports.
+#
+#   python benchmark.py                                # all operations on 10, 100 and 1000 line listings
+#   python benchmark.py --sizes large                  # also 5000 lines (listings are rebuilt each repeat, so slow)
+#   python benchmark.py --sizes 100 1000 --repeats 5 --operations insert_code set_code --output results.json
+#
+# For each operation and listing size the results have the best and median wall time, the peak memory allocated
+# (from tracemalloc, in a separate run so it does not skew the timing), and how many Code and Text mobjects were
+# constructed. The output is a single json document (to stdout or --output), a readable table goes to stderr.
+
+from manim import Scene, tempconfig
+import argparse
+import importlib.metadata
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import DynamicCode as dynamic_code
+from DynamicCode import DynamicCode
+
+
+def make_listing(n_lines: int, variant: int = 0) -> str:
+    # synthetic python listing with a mix of indentation, strings, numbers and comments
+    lines = []
+    for i in range(n_lines):
+        if i % 5 == 0:
+            lines.append(f'def function_{i}(x, y={variant}):')
+        elif i % 5 == 4:
+            lines.append(f'    return "result {i}"  # comment {i}')
+        else:
+            lines.append(f'    x = x * {i} + y  # step {i % 5}')
+    return '\n'.join(lines)
+
+
+class ConstructionCounter:
+    # count constructions of Code and Text by DynamicCode, which are the expensive text renders
+    def __init__(self):
+        self.counts = {'Code': 0, 'Text': 0}
+        self._originals = {}
+
+    def __enter__(self) -> 'ConstructionCounter':
+        for name in self.counts:
+            original = self._originals[name] = getattr(dynamic_code, name)
+            def counted(*args, __name=name, __original=original, **kwargs):
+                self.counts[__name] += 1
+                return __original(*args, **kwargs)
+            setattr(dynamic_code, name, counted)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for name, original in self._originals.items():
+            setattr(dynamic_code, name, original)
+
+
+# Each operation is (setup(n_lines) -> state, run(state)). Only run is measured.
+
+def setup_listing(n_lines: int):
+    return make_listing(n_lines)
+
+def setup_dcode(n_lines: int):
+    return DynamicCode(code=make_listing(n_lines), language='python')
+
+def setup_animated(n_lines: int):
+    dcode = setup_dcode(n_lines)
+    scene = Scene()  # headless as manim runs with dry_run
+    scene.add(dcode)
+    return dcode, scene
+
+def middle(dcode: DynamicCode) -> int:
+    return len(dcode.get_lines()) // 2
+
+def change_middle_line(dcode: DynamicCode):
+    lines = dcode.get_lines()
+    dcode.set_code('\n'.join([*lines[:middle(dcode)], '    x = changed(x)', *lines[middle(dcode) + 1:]]))
+
+# named --sizes, which can be mixed with sizes in lines
+SIZE_PRESETS = {
+    'default': [10, 100, 1000],
+    'large': [10, 100, 1000, 5000],
+}
+
+
+def parse_sizes(sizes: list[str]) -> list[int]:
+    # listing sizes in lines from numbers and SIZE_PRESETS names, in order and without repeats
+    n_lines = []
+    for size in sizes:
+        for n in SIZE_PRESETS[size] if size in SIZE_PRESETS else [int(size)]:
+            if n not in n_lines:
+                n_lines.append(n)
+    return n_lines
+
+
+def size_arg(size: str) -> str:
+    if size not in SIZE_PRESETS and not size.isdigit():
+        raise argparse.ArgumentTypeError(f'expected a number of lines or one of {", ".join(SIZE_PRESETS)}, got {size!r}')
+    return size
+
+
+OPERATIONS = {
+    'construct': (
+        setup_listing,
+        lambda listing: DynamicCode(code=listing, language='python'),
+    ),
+    'insert_code': (
+        setup_dcode,
+        lambda dcode: dcode.insert_code((middle(dcode), 0), 'y = compute(x) + 1\n'),
+    ),
+    'remove_code': (
+        setup_dcode,
+        lambda dcode: dcode.remove_code((middle(dcode), 0), (middle(dcode) + 1, 0)),
+    ),
+    'set_code': (
+        setup_dcode,
+        change_middle_line,
+    ),
+    'scroll_to_last_line': (
+        setup_dcode,
+        lambda dcode: dcode.scroll_to_last_line(),
+    ),
+    'set_background_size': (
+        setup_dcode,
+        lambda dcode: dcode.set_background_size(dcode.background_mobject.width + 1, dcode.background_mobject.height + 1),
+    ),
+    'animated_insert_code': (
+        setup_animated,
+        lambda state: state[0].insert_code((middle(state[0]), 0), 'y = compute(x) + 1\n', player=state[1], run_time=1),
+    ),
+}
+
+
+def run_benchmark(name: str, n_lines: int, repeats: int) -> dict:
+    setup, run = OPERATIONS[name]
+    times = []
+    with ConstructionCounter() as counter:
+        for i in range(repeats):
+            state = setup(n_lines)
+            counter.counts = dict.fromkeys(counter.counts, 0)
+            start = time.perf_counter()
+            run(state)
+            times.append(time.perf_counter() - start)
+    counts = counter.counts  # of the last run
+
+    state = setup(n_lines)
+    tracemalloc.start()
+    run(state)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'operation': name,
+        'n_lines': n_lines,
+        'repeats': repeats,
+        'time_min_s': min(times),
+        'time_median_s': statistics.median(times),
+        'peak_memory_bytes': peak,
+        'code_constructions': counts['Code'],
+        'text_constructions': counts['Text'],
+    }
+
+
+def package_version(package: str) -> str | None:
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description='Headless benchmarks for DynamicCode edit operations.')
+    parser.add_argument('--sizes', type=size_arg, nargs='+', default=['default'],
+                        help=f'listing sizes in lines or presets ({", ".join(SIZE_PRESETS)})')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--operations', nargs='+', choices=list(OPERATIONS), default=list(OPERATIONS))
+    parser.add_argument('--output', help='json file for the results (default stdout)')
+    args = parser.parse_args(argv)
+
+    config = {'dry_run': True, 'disable_caching': True, 'progress_bar': 'none', 'verbosity': 'ERROR'}
+    results = []
+    with tempconfig(config):
+        for name in args.operations:
+            for n_lines in parse_sizes(args.sizes):
+                result = run_benchmark(name, n_lines, args.repeats)
+                results.append(result)
+                print(
+                    f"{name:>22} {n_lines:>6} lines  {result['time_min_s'] * 1000:10.2f} ms"
+                    f"  {result['peak_memory_bytes'] / 1024**2:8.2f} MiB"
+                    f"  Code x{result['code_constructions']}  Text x{result['text_constructions']}",
+                    file=sys.stderr,
+                )
+
+    report = {
+        'python': platform.python_version(),
+        'versions': {package: package_version(package) for package in ('manim', 'pygments', 'numpy')},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
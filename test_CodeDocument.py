@@ -0,0 +1,154 @@
+# Headless checks of the text model (no manim needed):  python -m pytest test_CodeDocument.py
+import random
+import pytest
+from CodeDocument import CodeDocument
+
+
+CODE = '''def f(x):
+    return x + 1
+
+print(f(2))'''
+
+
+def random_code(rnd: random.Random, lines: list[str]) -> str:
+    return '\n'.join(rnd.choice(lines) for _ in range(rnd.randint(0, 8)))
+
+
+def test_diff_edits_round_trip():
+    # applying the diff of two versions of some code to the first gives the second
+    rnd = random.Random(0)
+    lines = ['def f(x):', '    return x + 1', '', 'print(f(2))', '    y = x * 2', 'x = 1', '# x + 1']
+    for trial in range(200):
+        old_code, new_code = random_code(rnd, lines), random_code(rnd, lines)
+        doc = CodeDocument(old_code, language='python')
+        doc.apply_edits(CodeDocument.diff_edits(old_code, new_code))
+        assert doc.text == new_code
+        assert doc.lines == new_code.split('\n')
+
+
+def test_diff_edits_unchanged():
+    assert CodeDocument.diff_edits(CODE, CODE) == []
+
+
+def test_apply_edits_batch():
+    # all positions refer to the code before the edits
+    doc = CodeDocument(CODE, language='python')
+    edited_rows = doc.apply_edits([((3, 0), (3, 5), 'return'), ((0, 4), (0, 5), 'g'), (1, 1, '    y = x\n')])
+    assert doc.text == 'def g(x):\n    y = x\n    return x + 1\n\nreturn(f(2))'
+    assert edited_rows == [(0, 1), (1, 3), (4, 5)]
+    with pytest.raises(ValueError):
+        doc.apply_edits([((0, 0), (0, 5), ''), ((0, 2), (0, 3), '')])
+
+
+def test_line_starts_after_edits():
+    # offsets and positions use line starts that are only recomputed over the edited lines
+    rnd = random.Random(0)
+    doc = CodeDocument(CODE, language='python')
+    for step in range(200):
+        lines = doc.lines
+        doc.offset(rnd.randrange(len(lines)))  # line starts known up to some line
+        start = doc.position(rnd.randint(0, len(doc.text)))
+        stop = doc.position(rnd.randint(doc.offset(start), len(doc.text)))
+        doc.apply_edits([(start, stop, rnd.choice(['', 'x', '\n', 'ab\ncd', '\n\n']))])
+        text = doc.text
+        line_starts = [0]
+        for line in doc.lines[:-1]:
+            line_starts.append(line_starts[-1] + len(line) + 1)
+        for line_index, line_start in enumerate(line_starts):
+            assert doc.offset(line_index) == line_start
+            assert doc.position(line_start) == (line_index, 0)
+        assert doc.position(len(text)) == (len(doc.lines) - 1, len(doc.lines[-1]))
+
+
+def test_splice_line_starts():
+    doc = CodeDocument('a\nbb\nccc\ndddd', language='python')
+    assert doc.offset(3) == 9
+    # 'bb' replaced by three lines
+    lines = ['a', 'x', 'yy', 'zzz', 'ccc', 'dddd']
+    doc.set_lines(lines, [None] * len(lines), None, None, changed_rows=(1, 2, 4))
+    # starts of the new lines are recomputed and those of the lines after them shifted
+    assert doc._line_starts == [0, 2, 4, 7, 11, 15]
+    assert [doc.offset(row) for row in range(len(lines))] == [0, 2, 4, 7, 11, 15]
+    assert doc.position(16) == (5, 1)
+
+
+def test_glyph_index():
+    doc = CodeDocument(CODE, language='python')
+    assert [doc.glyph_index(1, char_index) for char_index in range(len(doc.lines[1]) + 1)] == [0, 0, 0, 0, 0, 1, 2, 3, 4, 5, 6, 6, 7, 7, 8, 8, 9]
+    assert doc.glyph_index(2, 0) == 0
+    # prefix counts are reset for edited lines
+    doc.apply_edits([((1, 4), (1, 4), 'y = ')])
+    assert doc.glyph_index(1, len(doc.lines[1])) == 11
+
+
+def test_relex_string():
+    # inserting a string delimiter recolors the following lines, and only those up to where the lexer is back in sync
+    code = '\n'.join(['x = 1'] * 20)
+    doc = CodeDocument(code, language='python')
+    colors = [list(line_colors) for line_colors in doc.get_line_colors()]
+    doc.apply_edits([((2, 0), (2, 0), '"""')])
+    assert doc.line_colors[3:] != colors[3:]
+    assert_relexed(doc, 'python')
+    doc.apply_edits([((6, 0), (6, 0), '"""')])
+    assert_relexed(doc, 'python')
+    assert doc.line_colors[8:] == colors[8:]
+    assert doc.relex(doc.lines, doc.line_colors, doc.safe_lines, 10) == (10, 11)
+
+
+SAMPLES = {
+    'python': 'def f(x):\n    """doc\n    string"""\n    s = "a # b"  # c\n    return x\n\nclass A:\n    pass\n',
+    'php': '<?php\n$x = "a $b";\n/* c\n d */\nfunction f($y) {\n  return $y . \'s\';\n}\necho <<<EOT\nhi\nEOT;\n?>\n<p>html</p>\n',
+    'ruby': 'def f(x)\n  s = "a #{x} b"\n  # c\n  <<~EOS\n    heredoc\n  EOS\nend\nputs %w[a b]\n=begin\nx\n=end\n',
+    'javascript': 'function f(x) {\n  const s = `a ${x}\nb`;\n  // c\n  /* d\n  e */\n  return x / 2 / y;\n}\nlet r = /ab+c/g;\n',
+    'c': '#include <stdio.h>\n/* a\n b */\nint main() {\n  char *s = "x\\n";\n  // c\n  return 0;\n}\n',
+    'bash': 'f() {\n  echo "a $b"\n  cat <<EOF\nx\nEOF\n}\n# c\nx=$(ls)\n',
+    'html': '<html>\n<!-- a\n b -->\n<script>\nvar x = 1;\n</script>\n<style>\np { color: red; }\n</style>\n</html>\n',
+}
+
+# bits of code that open or close strings, comments, heredocs, embedded languages, etc.
+SNIPPETS = ['"', "'", '/*', '*/', '#', '//', '\n', 'x', '{', '}', '<?php ', '?>', '`', '"""', '<<EOF\n', '=begin\n',
+            '=end\n', ' ', '(', ')', '<!--', '-->', '/', '$']
+
+
+def random_edit(rnd: random.Random, lines: list[str]):
+    row = rnd.randrange(len(lines))
+    col = rnd.randint(0, len(lines[row]))
+    stop_col = rnd.randint(col, len(lines[row])) if rnd.random() < 0.3 else col
+    return (row, col), (row, stop_col), ''.join(rnd.choice(SNIPPETS) for _ in range(rnd.randint(1, 3)))
+
+
+def assert_relexed(doc: CodeDocument, language: str):
+    assert doc.line_colors == CodeDocument(doc.text, language=language).get_line_colors()
+
+
+@pytest.mark.parametrize('language', SAMPLES)
+def test_relex_single_edits(language):
+    # incremental highlighting after an edit matches highlighting the edited code from scratch
+    rnd = random.Random(0)
+    for trial in range(100):
+        doc = CodeDocument(SAMPLES[language], language=language)
+        doc.get_line_colors()
+        doc.apply_edits([random_edit(rnd, doc.lines)])
+        assert_relexed(doc, language)
+
+
+@pytest.mark.parametrize('language', ['python', 'php', 'ruby', 'c'])
+def test_relex_edit_sequences(language):
+    # Only languages whose multiline constructs are lexer states. Lexers that match e.g. a whole /* */ comment with a
+    # single regex look ahead past the edited lines, see the note in CodeDocument.relex.
+    rnd = random.Random(1)
+    for trial in range(50):
+        doc = CodeDocument(SAMPLES[language], language=language)
+        doc.get_line_colors()
+        for step in range(6):
+            doc.apply_edits([random_edit(rnd, doc.lines)])
+            assert_relexed(doc, language)
+
+
+def test_relex_unknown_lexer_state():
+    # the PHP lexer wraps another lexer, so its state is unknown and relexing carries on to the end of the code
+    doc = CodeDocument(SAMPLES['php'], language='php')
+    doc.get_line_colors()
+    assert not any(doc.safe_lines[1:])
+    doc.apply_edits([((1, 0), (1, 0), '/*')])
+    assert_relexed(doc, 'php')
@@ -0,0 +1,61 @@
+# Checks that construct and edit a DynamicCode, which need manim:  python -m pytest test_DynamicCode.py
+# (see test_CodeDocument.py for the headless checks of the text model)
+import pytest
+
+pytest.importorskip('manim')
+from manim import UL
+from DynamicCode import DynamicCode
+import numpy as np
+
+
+CODE = '''def f(x):
+    return x + 1
+
+print(f(2))'''
+
+
+def glyph_counts(code: str) -> list[int]:
+    return [sum(not char.isspace() for char in line) for line in code.split('\n')]
+
+
+def test_construct():
+    dcode = DynamicCode(code=CODE, language='python')
+    assert dcode.get_lines() == CODE.split('\n')
+    assert [len(line_vgroup) for line_vgroup in dcode.code] == glyph_counts(CODE)
+    assert len(dcode.line_numbers) == len(CODE.split('\n'))
+
+
+def test_insert_code():
+    dcode = DynamicCode(code=CODE, language='python')
+    dcode.insert_code((1, 0), '    y = x * 2\n')
+    code = dcode.code_string
+    assert code == CODE.replace('    return', '    y = x * 2\n    return')
+    assert [len(line_vgroup) for line_vgroup in dcode.code] == glyph_counts(code)
+
+
+def test_shrink_and_grow_background():
+    # the background keeps its top left corner and later edits stay on the grid however small it got
+    dcode = DynamicCode(code=CODE, language='python')
+    reference = DynamicCode(code=CODE, language='python')
+    top_left = dcode.background_mobject.get_corner(UL)
+    width, height = dcode.background_mobject.width, dcode.background_mobject.height
+    dcode.set_background_size(0.1, 0.1)
+    assert np.allclose(dcode.background_mobject.get_corner(UL), top_left)
+    dcode.set_background_size(width + 1, height)
+    assert np.allclose(dcode.background_mobject.get_corner(UL), top_left)
+    assert np.isclose(dcode.background_mobject.width, width + 1)
+    assert np.isclose(dcode.background_mobject.height, height)
+
+    for code in (dcode, reference):
+        code.insert_code((1, 0), '    y = x * 2\n')
+    for line_vgroup, reference_line_vgroup in zip(dcode.code, reference.code):
+        for glyph, reference_glyph in zip(line_vgroup, reference_line_vgroup):
+            assert np.allclose(glyph.points, reference_glyph.points)
+
+
+def test_line_numbers_right_aligned():
+    # line numbers are right aligned on their rendered width like Code's, also once the gutter grows
+    dcode = DynamicCode(code='\n'.join(f'x{i} = {i}' for i in range(8)), language='python')
+    dcode.insert_code((3, 0), ''.join(f'y{i} = {i}\n' for i in range(5)))
+    rights = [number_vgroup.get_right()[0] for number_vgroup in dcode.line_numbers]
+    assert np.allclose(rights, rights[0], atol=1e-3)
@@ -0,0 +1,30 @@
+# Checks that benchmark.py runs end to end on small listings:  python -m pytest test_benchmark.py
+import json
+import pytest
+
+pytest.importorskip('manim')
+import benchmark
+
+
+def test_benchmark_small_sizes(tmp_path):
+    output = tmp_path / 'results.json'
+    benchmark.main(['--sizes', '5', '20', '--repeats', '1', '--output', str(output)])
+    with open(output) as f:
+        report = json.load(f)
+    results = report['results']
+    assert [(result['operation'], result['n_lines']) for result in results] == [
+        (name, n_lines) for name in benchmark.OPERATIONS for n_lines in (5, 20)
+    ]
+    for result in results:
+        assert result['time_min_s'] >= 0
+        assert result['peak_memory_bytes'] > 0
+    # only construction renders the whole listing
+    assert all(result['code_constructions'] == (result['operation'] == 'construct') for result in results)
+
+
+def test_size_presets():
+    assert benchmark.parse_sizes(['default']) == [10, 100, 1000]
+    assert benchmark.parse_sizes(['large']) == [10, 100, 1000, 5000]
+    assert benchmark.parse_sizes(['5', 'default', '100']) == [5, 10, 100, 1000]
+    with pytest.raises(SystemExit):
+        benchmark.main(['--sizes', 'huge'])